@@ -0,0 +1,187 @@
+"""Compara la inscripción a eventos: transacción de varias consultas vs. la función register_event_participant.
+
+Uso (desde la raíz del repo, con DATABASE_URL en el .env y init_db ya ejecutado por el bot):
+
+    python -m benchmarks.bench_inscripcion --registrations 1000 --concurrency 100
+
+Crea un guild ficticio con un evento abierto sin límite, simula una avalancha de
+inscripciones de usuarios nuevos con cada variante y reporta inscripciones por
+segundo. Borra todas sus filas al terminar.
+"""
+import argparse
+import asyncio
+import time
+
+import asyncpg
+
+from core import database
+from core.config import DATABASE_URL
+
+
+# Guild inexistente en Discord: los snowflakes reales son mucho menores.
+BENCH_GUILD_ID = 2 ** 62 + 22
+BENCH_USER_BASE = 10 ** 15
+
+
+async def legacy_register(
+    guild_id: int,
+    user_id: int,
+    discord_tag: str,
+    nickname: str | None,
+    external_id: str | None,
+    country: str | None,
+):
+    """Copia de la versión anterior: ocho consultas con el lock del guild tomado."""
+    async with database.bot_pool.acquire() as conn:
+        async with conn.transaction():
+            await conn.execute("SELECT pg_advisory_xact_lock($1::bigint)", guild_id)
+            event = await conn.fetchrow("""
+                SELECT * FROM event_instances
+                WHERE guild_id=$1 AND status IN ('open', 'closed')
+                LIMIT 1
+                FOR UPDATE
+            """, guild_id)
+            if not event:
+                return "no_event", None
+            if event["status"] != "open":
+                return "closed", None
+
+            existing_registration = await conn.fetchrow("""
+                SELECT * FROM event_registrations
+                WHERE event_id=$1 AND user_id=$2
+            """, event["id"], user_id)
+            if existing_registration:
+                return "duplicate", existing_registration
+
+            profile = await conn.fetchrow("""
+                SELECT * FROM event_users WHERE guild_id=$1 AND user_id=$2
+            """, guild_id, user_id)
+            effective_external_id = (
+                profile["external_id"] if profile is not None else external_id
+            )
+            blacklisted = await conn.fetchval("""
+                SELECT EXISTS(
+                    SELECT 1 FROM event_blacklist
+                    WHERE guild_id=$1
+                      AND (external_id=$2 OR user_id=$3)
+                )
+            """, guild_id, effective_external_id, user_id)
+            if blacklisted:
+                return "blacklisted", None
+
+            if profile is None:
+                duplicate_external_id = await conn.fetchval("""
+                    SELECT EXISTS(
+                        SELECT 1 FROM event_users
+                        WHERE guild_id=$1 AND external_id=$2
+                    )
+                """, guild_id, external_id)
+                if duplicate_external_id:
+                    return "external_id_duplicate", None
+
+                profile = await conn.fetchrow("""
+                    INSERT INTO event_users (
+                        guild_id, user_id, discord_tag, nickname, external_id, country
+                    )
+                    VALUES ($1, $2, $3, $4, $5, $6)
+                    RETURNING *
+                """, guild_id, user_id, discord_tag, nickname, external_id, country)
+            else:
+                await conn.execute("""
+                    UPDATE event_users
+                    SET discord_tag=$3, updated_at=CURRENT_TIMESTAMP
+                    WHERE guild_id=$1 AND user_id=$2
+                """, guild_id, user_id, discord_tag)
+
+            participant_count = await conn.fetchval(
+                "SELECT COUNT(*) FROM event_registrations WHERE event_id=$1",
+                event["id"],
+            )
+            position = participant_count + 1
+            registration = await conn.fetchrow("""
+                INSERT INTO event_registrations (
+                    event_id, guild_id, user_id, position, is_overflow
+                )
+                VALUES ($1, $2, $3, $4, $5)
+                RETURNING *
+            """, event["id"], guild_id, user_id, position,
+                 event["participant_limit"] > 0 and position > event["participant_limit"])
+            return "registered", {
+                "event": event,
+                "profile": profile,
+                "registration": registration,
+            }
+
+
+async def cleanup():
+    async with database.bot_pool.acquire() as conn:
+        async with conn.transaction():
+            await conn.execute("DELETE FROM event_instances WHERE guild_id=$1", BENCH_GUILD_ID)
+            await conn.execute("DELETE FROM event_users WHERE guild_id=$1", BENCH_GUILD_ID)
+            await conn.execute("DELETE FROM event_catalog WHERE guild_id=$1", BENCH_GUILD_ID)
+
+
+async def prepare_event():
+    await cleanup()
+    _, catalog_event = await database.add_event_catalog(
+        BENCH_GUILD_ID, "Benchmark", "benchmark", 0, 1
+    )
+    status, event = await database.create_active_event(
+        BENCH_GUILD_ID, catalog_event["id"], 0, 0, 0
+    )
+    if status != "created":
+        raise RuntimeError(f"No se pudo crear el evento de prueba: {status}")
+
+
+async def run_rush(register, registrations: int, concurrency: int):
+    await prepare_event()
+    semaphore = asyncio.Semaphore(concurrency)
+    statuses = {}
+
+    async def click(index: int):
+        user_id = BENCH_USER_BASE + index
+        async with semaphore:
+            status, _ = await register(
+                BENCH_GUILD_ID, user_id, f"bench#{index}", f"bench{index}", f"ext-{index}", "BR"
+            )
+        statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(click(index) for index in range(registrations)))
+    return statuses, time.perf_counter() - started
+
+
+def report(name: str, statuses: dict, elapsed: float):
+    registered = statuses.get("registered", 0)
+    rate = registered / elapsed
+    print(f"{name:<10} {registered:6d} inscritos en {elapsed:7.2f} s | {rate:8.1f} inscripciones/s | {statuses}")
+    return rate
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--registrations", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    args = parser.parse_args()
+
+    # Mismo pool por defecto que init_db, sin ejecutar sus migraciones.
+    database.bot_pool = await asyncpg.create_pool(DATABASE_URL)
+    try:
+        print(
+            f"{args.registrations} inscripciones, {args.concurrency} concurrentes, "
+            f"pool de {database.bot_pool.get_max_size()} conexiones"
+        )
+        legacy = report("anterior", *await run_rush(
+            legacy_register, args.registrations, args.concurrency
+        ))
+        function = report("función", *await run_rush(
+            database.register_event_participant, args.registrations, args.concurrency
+        ))
+        print(f"Mejora de throughput: {function / legacy:.1f}x")
+    finally:
+        await cleanup()
+        await database.bot_pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
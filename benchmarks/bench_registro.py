@@ -0,0 +1,97 @@
+"""Compara el pre-chequeo de "Registrarse": cinco consultas secuenciales vs. get_registration_context.
+
+Uso (desde la raíz del repo, con DATABASE_URL en el .env):
+
+    python -m benchmarks.bench_registro --guild <guild_id> --user <user_id> --clicks 500 --concurrency 100
+
+Simula ráfagas de clics concurrentes contra un pool del mismo tamaño que el del bot
+y reporta latencia por clic (media, p50, p95, p99) y throughput de cada variante.
+Solo hace lecturas.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import asyncpg
+
+from core import database
+from core.config import DATABASE_URL
+
+
+async def sequential_precheck(guild_id: int, user_id: int):
+    event = await database.get_active_event(guild_id)
+    if not event:
+        return
+    await database.get_event_registration(event["id"], user_id)
+    profile = await database.get_event_user(guild_id, user_id)
+    await database.get_event_blacklist_match(
+        guild_id,
+        profile["external_id"] if profile else None,
+        user_id,
+    )
+    await database.get_event_participant_count(event["id"])
+
+
+async def combined_precheck(guild_id: int, user_id: int):
+    await database.get_registration_context(guild_id, user_id)
+
+
+async def run_burst(precheck, guild_id: int, user_id: int, clicks: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def click():
+        async with semaphore:
+            started = time.perf_counter()
+            await precheck(guild_id, user_id)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(click() for _ in range(clicks)))
+    return latencies, time.perf_counter() - started
+
+
+def report(name: str, latencies, elapsed: float):
+    ordered = sorted(latencies)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000
+
+    print(
+        f"{name:<12} media {statistics.mean(ordered) * 1000:7.2f} ms | "
+        f"p50 {percentile(0.50):7.2f} ms | p95 {percentile(0.95):7.2f} ms | "
+        f"p99 {percentile(0.99):7.2f} ms | {len(ordered) / elapsed:8.1f} clics/s"
+    )
+    return statistics.mean(ordered)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--guild", type=int, required=True)
+    parser.add_argument("--user", type=int, required=True)
+    parser.add_argument("--clicks", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--warmup", type=int, default=20)
+    args = parser.parse_args()
+
+    # Mismo pool por defecto que init_db, sin ejecutar sus migraciones.
+    database.bot_pool = await asyncpg.create_pool(DATABASE_URL)
+    try:
+        for precheck in (sequential_precheck, combined_precheck):
+            await run_burst(precheck, args.guild, args.user, args.warmup, args.concurrency)
+
+        print(f"{args.clicks} clics, {args.concurrency} concurrentes, pool de {database.bot_pool.get_max_size()} conexiones")
+        sequential = report("secuencial", *await run_burst(
+            sequential_precheck, args.guild, args.user, args.clicks, args.concurrency
+        ))
+        combined = report("combinada", *await run_burst(
+            combined_precheck, args.guild, args.user, args.clicks, args.concurrency
+        ))
+        print(f"Mejora de latencia media: {sequential / combined:.1f}x")
+    finally:
+        await database.bot_pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
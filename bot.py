@@ -1,23 +1,31 @@
 import asyncio
 
 import discord
-from discord.ext import commands, tasks
+from discord.ext import commands
 
 from core.config import GUILD_ID, TOKEN, intents
-from core.database import init_db
-from modules import posts, registro_eventos, registros
+from core.database import DB_LISTENER, init_db
+from core.http_client import close_http_session, open_http_session
+from core.image_processing import shutdown_image_executor
+from core.r2_storage import R2_CLEANUP_QUEUE, shutdown_r2_executor
+from modules import importar_posts, limpieza_r2, posts, registro_eventos, registros
 
 
 class MyBot(commands.Bot):
     async def setup_hook(self):
         await init_db()
+        await open_http_session()
+        R2_CLEANUP_QUEUE.start()
         await posts.load_cache()
 
         registros.setup(self)
         posts.setup(self)
         registro_eventos.setup(self)
+        limpieza_r2.setup(self)
+        importar_posts.setup(self)
+        DB_LISTENER.start()
 
-        self.check_scheduled_posts_task.start()
+        self.post_scheduler_task = self.loop.create_task(posts.run_post_scheduler(self))
 
         if not GUILD_ID:
             print("❌ Falta GUILD_ID en las variables de entorno. No sincronizo comandos.")
@@ -34,14 +42,25 @@ class MyBot(commands.Bot):
             print("🧾 Comandos cargados en el árbol:", cmds)
             print("👉 Si esta lista sale vacía, tus comandos no están registrándose antes del sync.")
 
-    @tasks.loop(minutes=1)
-    async def check_scheduled_posts_task(self):
-        await posts.publish_due_posts(self)
-
-    @check_scheduled_posts_task.before_loop
-    async def before_check(self):
-        await self.wait_until_ready()
-        await asyncio.sleep(5)
+    async def close(self):
+        # Primero el scheduler, para que no publique con la sesión HTTP o la DB ya cerradas.
+        post_scheduler_task = getattr(self, "post_scheduler_task", None)
+        if post_scheduler_task is not None:
+            post_scheduler_task.cancel()
+            try:
+                await post_scheduler_task
+            except asyncio.CancelledError:
+                pass
+            except Exception as e:
+                print(f"⚠️ El scheduler de posts terminó con error: {e}")
+        try:
+            await super().close()
+            await close_http_session()
+            await DB_LISTENER.stop()
+            await R2_CLEANUP_QUEUE.stop()
+        finally:
+            shutdown_r2_executor()
+            shutdown_image_executor()
 
 
 bot = MyBot(command_prefix="_", intents=intents)
@@ -0,0 +1,173 @@
+import asyncio
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+
+from core.config import ATTACHMENT_CACHE_DIR, ATTACHMENT_CACHE_MAX_BYTES
+
+
+class AttachmentCacheWriter:
+    def __init__(self, cache: "AttachmentCache"):
+        self.cache = cache
+        self.size = 0
+        self.path = None
+        self.file = None
+        if cache.enabled:
+            cache.directory.mkdir(parents=True, exist_ok=True)
+            self.path = cache.directory / f".tmp-{uuid.uuid4().hex}"
+            self.file = open(self.path, "wb")
+
+    def write(self, chunk: bytes):
+        if self.file is None:
+            return
+        self.size += len(chunk)
+        if self.size > self.cache.max_bytes:
+            self.discard()
+            return
+        self.file.write(chunk)
+
+    def commit(self, key: str):
+        if self.file is None:
+            return None
+        self.file.close()
+        self.file = None
+        return self.cache.adopt(key, self.path, self.size)
+
+    def discard(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.path is not None:
+            self.path.unlink(missing_ok=True)
+            self.path = None
+
+
+class AttachmentCache:
+    """Cache LRU en disco de los adjuntos subidos a R2, indexada por la key del objeto.
+
+    Los métodos síncronos hacen I/O de disco y son seguros entre hilos; desde el
+    loop se usan sus variantes async, que los ejecutan con asyncio.to_thread.
+    """
+
+    def __init__(self, directory, max_bytes: int):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._loaded = False
+        self._lock = threading.RLock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key.replace("/", "__")
+
+    def _ensure_loaded(self):
+        with self._lock:
+            self._load()
+
+    def _load(self):
+        if self._loaded or not self.enabled:
+            return
+        self._loaded = True
+        if not self.directory.exists():
+            return
+        files = []
+        for path in self.directory.iterdir():
+            if path.name.startswith(".tmp-"):
+                path.unlink(missing_ok=True)
+                continue
+            stat = path.stat()
+            files.append((stat.st_mtime, path, stat.st_size))
+        for _, path, size in sorted(files):
+            self._entries[path.name.replace("__", "/")] = size
+            self._size += size
+        self._evict_to_fit()
+
+    def writer(self) -> AttachmentCacheWriter:
+        self._ensure_loaded()
+        return AttachmentCacheWriter(self)
+
+    def adopt(self, key: str, source: Path, size: int):
+        if not self.enabled or size > self.max_bytes:
+            Path(source).unlink(missing_ok=True)
+            return None
+        with self._lock:
+            self._load()
+            self.evict(key)
+            path = self._path(key)
+            os.replace(source, path)
+            self._entries[key] = size
+            self._size += size
+            self._evict_to_fit()
+            return path if key in self._entries else None
+
+    def put_bytes(self, key: str, data: bytes):
+        if not self.enabled or len(data) > self.max_bytes:
+            return None
+        writer = self.writer()
+        writer.write(data)
+        return writer.commit(key)
+
+    def get_path(self, key: str):
+        with self._lock:
+            self._load()
+            if key not in self._entries:
+                return None
+            path = self._path(key)
+            if not path.exists():
+                self._size -= self._entries.pop(key)
+                return None
+            self._entries.move_to_end(key)
+            return path
+
+    def read_bytes(self, key: str):
+        path = self.get_path(key)
+        if path is None:
+            return None
+        try:
+            return path.read_bytes()
+        except OSError:
+            self.evict(key)
+            return None
+
+    def evict(self, key: str):
+        with self._lock:
+            size = self._entries.pop(key, None)
+            if size is None:
+                return
+            self._size -= size
+            self._path(key).unlink(missing_ok=True)
+
+    def evict_many(self, keys):
+        for key in keys:
+            self.evict(key)
+
+    async def get_path_async(self, key: str):
+        return await asyncio.to_thread(self.get_path, key)
+
+    async def read_bytes_async(self, key: str):
+        return await asyncio.to_thread(self.read_bytes, key)
+
+    async def put_bytes_async(self, key: str, data: bytes):
+        if not self.enabled or len(data) > self.max_bytes:
+            return None
+        return await asyncio.to_thread(self.put_bytes, key, data)
+
+    async def evict_async(self, key: str):
+        await asyncio.to_thread(self.evict, key)
+
+    async def evict_many_async(self, keys):
+        await asyncio.to_thread(self.evict_many, list(keys))
+
+    def _evict_to_fit(self):
+        while self._size > self.max_bytes and self._entries:
+            key = next(iter(self._entries))
+            self.evict(key)
+
+
+ATTACHMENT_CACHE = AttachmentCache(ATTACHMENT_CACHE_DIR, ATTACHMENT_CACHE_MAX_BYTES)
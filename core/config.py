@@ -1,4 +1,5 @@
 import os
+import socket
 from pathlib import Path
 from zoneinfo import ZoneInfo
 
@@ -45,6 +46,67 @@ def env_int(name: str, default: int = 0) -> int:
     return int(value) if value.isdigit() else default
 
 
+# S3 exige partes de al menos 5 MiB en subidas multipart (salvo la última).
+R2_MIN_PART_SIZE = 5 * 1024 * 1024
+R2_UPLOAD_CHUNK_SIZE = max(R2_MIN_PART_SIZE, env_int("R2_UPLOAD_CHUNK_SIZE", 8 * 1024 * 1024))
+# Los adjuntos hasta este tamaño se hashean antes de subir para no repetir contenido.
+R2_DEDUP_MAX_BYTES = max(0, env_int("R2_DEDUP_MAX_BYTES", 100 * 1024 * 1024))
+R2_STREAM_READ_SIZE = max(1024, env_int("R2_STREAM_READ_SIZE", 64 * 1024))
+R2_MAX_WORKERS = max(1, env_int("R2_MAX_WORKERS", 8))
+R2_CONNECT_TIMEOUT_SECONDS = max(1, env_int("R2_CONNECT_TIMEOUT_SECONDS", 5))
+R2_READ_TIMEOUT_SECONDS = max(1, env_int("R2_READ_TIMEOUT_SECONDS", 30))
+R2_MAX_ATTEMPTS = max(1, env_int("R2_MAX_ATTEMPTS", 4))
+R2_CLEANUP_FLUSH_SECONDS = max(1, env_int("R2_CLEANUP_FLUSH_SECONDS", 5))
+R2_CLEANUP_MAX_ATTEMPTS = max(1, env_int("R2_CLEANUP_MAX_ATTEMPTS", 5))
+R2_GC_GRACE_HOURS = max(1, env_int("R2_GC_GRACE_HOURS", 6))
+R2_GC_INTERVAL_HOURS = max(1, env_int("R2_GC_INTERVAL_HOURS", 24))
+# La limpieza periódica solo reporta salvo que se habilite el borrado con R2_GC_DRY_RUN=0.
+R2_GC_DRY_RUN = os.getenv("R2_GC_DRY_RUN", "1") != "0"
+HTTP_POOL_SIZE = max(1, env_int("HTTP_POOL_SIZE", 32))
+ATTACHMENT_TRANSFER_CONCURRENCY = max(1, env_int("ATTACHMENT_TRANSFER_CONCURRENCY", 4))
+ATTACHMENT_CACHE_DIR = Path(os.getenv("ATTACHMENT_CACHE_DIR", BASE_DIR / ".cache" / "adjuntos"))
+ATTACHMENT_CACHE_MAX_BYTES = env_int("ATTACHMENT_CACHE_MAX_BYTES", 512 * 1024 * 1024)
+
+
+def env_guild_ints(name: str) -> dict[int, int]:
+    """Lee pares "guild_id:valor" separados por comas."""
+    values = {}
+    for item in os.getenv(name, "").split(","):
+        guild_id, _, value = item.strip().partition(":")
+        if guild_id.isdigit() and value.strip().isdigit():
+            values[int(guild_id)] = int(value.strip())
+    return values
+
+
+# Procesamiento de imágenes antes de subirlas a R2 (opcional, requiere Pillow).
+# Desactivado por defecto: re-codifica con pérdida y elimina metadatos.
+IMAGE_PROCESSING_ENABLED = os.getenv("IMAGE_PROCESSING_ENABLED", "0") == "1"
+IMAGE_PROCESS_WORKERS = max(1, env_int("IMAGE_PROCESS_WORKERS", 2))
+IMAGE_MIN_BYTES = env_int("IMAGE_MIN_BYTES", 512 * 1024)
+IMAGE_MAX_INPUT_BYTES = env_int("IMAGE_MAX_INPUT_BYTES", 25 * 1024 * 1024)
+IMAGE_MAX_DIMENSION = max(256, env_int("IMAGE_MAX_DIMENSION", 2560))
+IMAGE_OUTPUT_FORMAT = "JPEG" if os.getenv("IMAGE_OUTPUT_FORMAT", "webp").lower() in {"jpg", "jpeg"} else "WEBP"
+IMAGE_QUALITY = min(100, max(1, env_int("IMAGE_QUALITY", 82)))
+IMAGE_QUALITY_BY_GUILD = {
+    guild_id: min(100, max(1, quality))
+    for guild_id, quality in env_guild_ints("IMAGE_QUALITY_BY_GUILD").items()
+}
+
+
+# Publicaciones agendadas.
+POST_PUBLISH_CONCURRENCY = max(1, env_int("POST_PUBLISH_CONCURRENCY", 4))
+POST_PREFETCH_LEAD_SECONDS = env_int("POST_PREFETCH_LEAD_SECONDS", 300)
+POST_PREFETCH_MAX_POSTS = env_int("POST_PREFETCH_MAX_POSTS", 20)
+POST_PREFETCH_MAX_BYTES = env_int("POST_PREFETCH_MAX_BYTES", 64 * 1024 * 1024)
+# Solo los posts que vencen dentro de esta ventana se mantienen completos en memoria.
+POST_LOAD_WINDOW_SECONDS = max(600, env_int("POST_LOAD_WINDOW_HOURS", 24) * 3600)
+# Identifica a este proceso al reclamar posts cuando corren varios workers.
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+POST_CLAIM_LEASE_SECONDS = max(30, env_int("POST_CLAIM_LEASE_SECONDS", 300))
+POST_CLAIM_BATCH_SIZE = max(1, env_int("POST_CLAIM_BATCH_SIZE", 50))
+POST_CLAIM_SWEEP_SECONDS = max(5, env_int("POST_CLAIM_SWEEP_SECONDS", 60))
+
+
 # Registro y gestion de eventos.
 EVENT_VERIFIED_ROLE_ID = 1527103455313793136
 EVENT_PARTICIPANT_ROLE_ID = 1507215915396239410
@@ -59,6 +121,8 @@ EVENT_ALLOWED_CHANNEL_IDS = frozenset({
 })
 EVENT_PARTICIPANT_LIMITS = (0, 10, 15, 20)
 EVENT_CATALOG_MAX_ITEMS = 5
+# Caducidad de seguridad del evento activo cacheado; los cambios llegan por NOTIFY.
+EVENT_CACHE_TTL_SECONDS = max(10, env_int("EVENT_CACHE_TTL_SECONDS", 300))
 
 
 TZ_BRASILIA = ZoneInfo("America/Sao_Paulo")
@@ -1,9 +1,92 @@
+import asyncio
+import json
+
 import asyncpg
 
 from core.config import DATABASE_URL
 
 
 bot_pool = None
+LISTENER_RECONNECT_SECONDS = 5
+LISTENER_HEALTHCHECK_SECONDS = 60
+
+
+class DatabaseListener:
+    """Conexión dedicada a LISTEN que reparte los NOTIFY de PostgreSQL entre handlers.
+
+    Si la conexión se pierde se reconecta y llama a los handlers de reconexión,
+    ya que los NOTIFY emitidos mientras tanto no se recuperan.
+    """
+
+    def __init__(self):
+        self._handlers = {}
+        self._reconnect_handlers = []
+        self._conn = None
+        self._task = None
+
+    def subscribe(self, channel: str, handler, on_reconnect=None):
+        self._handlers.setdefault(channel, []).append(handler)
+        if on_reconnect is not None:
+            self._reconnect_handlers.append(on_reconnect)
+
+    def _dispatch(self, conn, pid, channel, payload):
+        for handler in self._handlers.get(channel, ()):
+            try:
+                handler(payload)
+            except Exception as e:
+                print(f"⚠️ Error procesando NOTIFY de {channel}: {e}")
+
+    async def _listen_once(self):
+        lost = asyncio.Event()
+        self._conn = await asyncpg.connect(DATABASE_URL)
+        self._conn.add_termination_listener(lambda conn: lost.set())
+        for channel in self._handlers:
+            await self._conn.add_listener(channel, self._dispatch)
+        return lost
+
+    async def run(self):
+        resync = False
+        while True:
+            try:
+                lost = await self._listen_once()
+                if resync:
+                    print("🔁 Listener de PostgreSQL reconectado; resincronizando caches.")
+                    for handler in self._reconnect_handlers:
+                        await handler()
+                while not lost.is_set():
+                    try:
+                        await asyncio.wait_for(lost.wait(), LISTENER_HEALTHCHECK_SECONDS)
+                    except asyncio.TimeoutError:
+                        await self._conn.execute("SELECT 1")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Listener de PostgreSQL desconectado: {e}")
+            finally:
+                await self._close_connection()
+            resync = True
+            await asyncio.sleep(LISTENER_RECONNECT_SECONDS)
+
+    async def _close_connection(self):
+        if self._conn is not None and not self._conn.is_closed():
+            try:
+                await self._conn.close(timeout=5)
+            except Exception:
+                self._conn.terminate()
+        self._conn = None
+
+    def start(self):
+        if self._handlers and (self._task is None or self._task.done()):
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self._close_connection()
+
+
+DB_LISTENER = DatabaseListener()
 
 
 async def init_db():
@@ -32,6 +115,18 @@ async def init_db():
                     thread_name TEXT DEFAULT NULL,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 );
+                CREATE TABLE IF NOT EXISTS r2_objects (
+                    key TEXT PRIMARY KEY,
+                    size BIGINT NOT NULL DEFAULT 0,
+                    ref_count INTEGER NOT NULL DEFAULT 0,
+                    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+                );
+                -- Las filas existentes ya tienen su objeto en R2.
+                ALTER TABLE r2_objects
+                    ADD COLUMN IF NOT EXISTS uploaded BOOLEAN NOT NULL DEFAULT TRUE;
+                -- Una fila en purging tiene su borrado en R2 en curso y no se reutiliza.
+                ALTER TABLE r2_objects
+                    ADD COLUMN IF NOT EXISTS purging BOOLEAN NOT NULL DEFAULT FALSE;
                 CREATE TABLE IF NOT EXISTS event_catalog (
                     id SERIAL PRIMARY KEY,
                     guild_id BIGINT NOT NULL,
@@ -100,11 +195,232 @@ async def init_db():
                     FOREIGN KEY (guild_id, user_id)
                         REFERENCES event_users(guild_id, user_id) ON DELETE RESTRICT
                 );
+                ALTER TABLE event_instances
+                    ADD COLUMN IF NOT EXISTS participant_count INTEGER NOT NULL DEFAULT 0;
+                UPDATE event_instances AS e
+                SET participant_count = counts.total
+                FROM (
+                    SELECT i.id, COALESCE(COUNT(r.event_id), 0)::INTEGER AS total
+                    FROM event_instances AS i
+                    LEFT JOIN event_registrations AS r ON r.event_id = i.id
+                    GROUP BY i.id
+                ) AS counts
+                WHERE e.id = counts.id
+                  AND e.participant_count <> counts.total;
+                CREATE OR REPLACE FUNCTION register_event_participant(
+                    p_guild_id BIGINT,
+                    p_user_id BIGINT,
+                    p_discord_tag TEXT,
+                    p_nickname TEXT,
+                    p_external_id TEXT,
+                    p_country TEXT
+                )
+                RETURNS TABLE (
+                    status TEXT,
+                    event event_instances,
+                    profile event_users,
+                    registration event_registrations
+                )
+                LANGUAGE plpgsql AS $$
+                #variable_conflict use_column
+                DECLARE
+                    v_has_profile BOOLEAN;
+                    v_external_id TEXT;
+                    v_position INTEGER;
+                BEGIN
+                    -- Mismo lock por guild que el resto de escrituras de eventos.
+                    PERFORM pg_advisory_xact_lock(p_guild_id);
+
+                    SELECT * INTO event
+                    FROM event_instances AS e
+                    WHERE e.guild_id = p_guild_id AND e.status IN ('open', 'closed')
+                    LIMIT 1
+                    FOR UPDATE;
+                    IF NOT FOUND THEN
+                        status := 'no_event';
+                        RETURN NEXT;
+                        RETURN;
+                    END IF;
+                    IF event.status <> 'open' THEN
+                        status := 'closed';
+                        RETURN NEXT;
+                        RETURN;
+                    END IF;
+
+                    SELECT * INTO registration
+                    FROM event_registrations AS r
+                    WHERE r.event_id = event.id AND r.user_id = p_user_id;
+                    IF FOUND THEN
+                        status := 'duplicate';
+                        RETURN NEXT;
+                        RETURN;
+                    END IF;
+
+                    SELECT * INTO profile
+                    FROM event_users AS u
+                    WHERE u.guild_id = p_guild_id AND u.user_id = p_user_id;
+                    v_has_profile := FOUND;
+                    v_external_id := CASE WHEN v_has_profile THEN profile.external_id ELSE p_external_id END;
+
+                    IF EXISTS (
+                        SELECT 1 FROM event_blacklist AS b
+                        WHERE b.guild_id = p_guild_id
+                          AND (b.external_id = v_external_id OR b.user_id = p_user_id)
+                    ) THEN
+                        status := 'blacklisted';
+                        RETURN NEXT;
+                        RETURN;
+                    END IF;
+
+                    IF NOT v_has_profile THEN
+                        IF EXISTS (
+                            SELECT 1 FROM event_users AS u
+                            WHERE u.guild_id = p_guild_id AND u.external_id = p_external_id
+                        ) THEN
+                            status := 'external_id_duplicate';
+                            RETURN NEXT;
+                            RETURN;
+                        END IF;
+                        INSERT INTO event_users (
+                            guild_id, user_id, discord_tag, nickname, external_id, country
+                        )
+                        VALUES (p_guild_id, p_user_id, p_discord_tag, p_nickname, p_external_id, p_country)
+                        RETURNING * INTO profile;
+                    ELSE
+                        UPDATE event_users AS u
+                        SET discord_tag = p_discord_tag, updated_at = CURRENT_TIMESTAMP
+                        WHERE u.guild_id = p_guild_id AND u.user_id = p_user_id;
+                    END IF;
+
+                    UPDATE event_instances AS e
+                    SET participant_count = e.participant_count + 1
+                    WHERE e.id = event.id
+                    RETURNING e.* INTO event;
+                    v_position := event.participant_count;
+                    INSERT INTO event_registrations (
+                        event_id, guild_id, user_id, position, is_overflow
+                    )
+                    VALUES (
+                        event.id, p_guild_id, p_user_id, v_position,
+                        event.participant_limit > 0 AND v_position > event.participant_limit
+                    )
+                    RETURNING * INTO registration;
+                    status := 'registered';
+                    RETURN NEXT;
+                END;
+                $$;
             """)
         print("✅ Conexion a PostgreSQL exitosa y tablas verificadas.")
         async with bot_pool.acquire() as conn:
             await conn.execute("""
                 ALTER TABLE scheduled_posts ADD COLUMN IF NOT EXISTS thread_name TEXT DEFAULT NULL;
+                ALTER TABLE scheduled_posts ADD COLUMN IF NOT EXISTS publish_attempts INTEGER NOT NULL DEFAULT 0;
+                ALTER TABLE scheduled_posts ADD COLUMN IF NOT EXISTS next_attempt_at TIMESTAMP WITH TIME ZONE;
+                ALTER TABLE scheduled_posts ADD COLUMN IF NOT EXISTS last_error TEXT;
+                ALTER TABLE scheduled_posts ADD COLUMN IF NOT EXISTS claimed_by TEXT;
+                ALTER TABLE scheduled_posts ADD COLUMN IF NOT EXISTS claim_expires_at TIMESTAMP WITH TIME ZONE;
+                ALTER TABLE scheduled_posts ADD COLUMN IF NOT EXISTS recurrence TEXT;
+                CREATE INDEX IF NOT EXISTS scheduled_posts_scheduled_at_idx
+                    ON scheduled_posts (scheduled_at);
+                CREATE INDEX IF NOT EXISTS scheduled_posts_guild_scheduled_at_idx
+                    ON scheduled_posts (guild_id, scheduled_at);
+                CREATE INDEX IF NOT EXISTS scheduled_posts_due_at_idx
+                    ON scheduled_posts ((COALESCE(next_attempt_at, scheduled_at)));
+                CREATE TABLE IF NOT EXISTS scheduled_posts_dead_letter (
+                    id INTEGER PRIMARY KEY,
+                    guild_id BIGINT NOT NULL,
+                    channel_id BIGINT NOT NULL,
+                    title TEXT,
+                    content TEXT,
+                    attachment_urls TEXT[],
+                    scheduled_at TIMESTAMP WITH TIME ZONE NOT NULL,
+                    author_id BIGINT NOT NULL,
+                    thread_name TEXT,
+                    publish_attempts INTEGER NOT NULL,
+                    last_error TEXT,
+                    failed_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+                );
+                CREATE INDEX IF NOT EXISTS scheduled_posts_dead_letter_guild_idx
+                    ON scheduled_posts_dead_letter (guild_id, failed_at DESC);
+                ALTER TABLE scheduled_posts_dead_letter ADD COLUMN IF NOT EXISTS recurrence TEXT;
+                CREATE OR REPLACE FUNCTION notify_scheduled_posts_change() RETURNS trigger AS $$
+                DECLARE
+                    post_id INTEGER;
+                BEGIN
+                    IF TG_OP = 'DELETE' THEN
+                        post_id := OLD.id;
+                    ELSE
+                        post_id := NEW.id;
+                    END IF;
+                    PERFORM pg_notify(
+                        'scheduled_posts_changes',
+                        json_build_object('op', TG_OP, 'id', post_id)::text
+                    );
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql;
+                -- Los cambios de lease (claimed_by, claim_expires_at) no se notifican.
+                DROP TRIGGER IF EXISTS scheduled_posts_notify ON scheduled_posts;
+                CREATE TRIGGER scheduled_posts_notify
+                    AFTER INSERT OR DELETE OR UPDATE OF
+                        guild_id, channel_id, title, content, attachment_urls,
+                        scheduled_at, thread_name, publish_attempts, next_attempt_at, recurrence
+                    ON scheduled_posts
+                    FOR EACH ROW EXECUTE FUNCTION notify_scheduled_posts_change();
+                CREATE OR REPLACE FUNCTION notify_event_instances_change() RETURNS trigger AS $$
+                DECLARE
+                    changed event_instances;
+                BEGIN
+                    IF TG_OP = 'DELETE' THEN
+                        changed := OLD;
+                    ELSE
+                        changed := NEW;
+                    END IF;
+                    PERFORM pg_notify(
+                        'event_instances_changes',
+                        json_build_object(
+                            'op', TG_OP,
+                            'id', changed.id,
+                            'guild_id', changed.guild_id,
+                            'status', changed.status,
+                            'registration_message_id', changed.registration_message_id
+                        )::text
+                    );
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql;
+                -- participant_count cambia con cada inscripción y no se notifica.
+                DROP TRIGGER IF EXISTS event_instances_notify ON event_instances;
+                CREATE TRIGGER event_instances_notify
+                    AFTER INSERT OR DELETE OR UPDATE OF status, registration_message_id
+                    ON event_instances
+                    FOR EACH ROW EXECUTE FUNCTION notify_event_instances_change();
+                CREATE OR REPLACE FUNCTION notify_event_blacklist_change() RETURNS trigger AS $$
+                DECLARE
+                    changed event_blacklist;
+                BEGIN
+                    IF TG_OP = 'DELETE' THEN
+                        changed := OLD;
+                    ELSE
+                        changed := NEW;
+                    END IF;
+                    PERFORM pg_notify(
+                        'event_blacklist_changes',
+                        json_build_object(
+                            'op', TG_OP,
+                            'guild_id', changed.guild_id,
+                            'user_id', changed.user_id,
+                            'external_id', changed.external_id
+                        )::text
+                    );
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql;
+                DROP TRIGGER IF EXISTS event_blacklist_notify ON event_blacklist;
+                CREATE TRIGGER event_blacklist_notify
+                    AFTER INSERT OR DELETE OR UPDATE
+                    ON event_blacklist
+                    FOR EACH ROW EXECUTE FUNCTION notify_event_blacklist_change();
             """)
     except Exception as e:
         print(f"❌ Error conectando a la DB: {e}")
@@ -305,6 +621,14 @@ async def get_event_blacklist(guild_id: int):
         """, guild_id)
 
 
+async def get_all_event_blacklists():
+    async with bot_pool.acquire() as conn:
+        return await conn.fetch("""
+            SELECT * FROM event_blacklist
+            ORDER BY guild_id, created_at ASC, external_id ASC
+        """)
+
+
 async def add_event_blacklist(
     guild_id: int,
     user_id: int,
@@ -464,6 +788,13 @@ async def delete_event_user_profile(guild_id: int, user_id: int):
                     FROM ordered
                     WHERE r.event_id=$1 AND r.user_id=ordered.user_id
                 """, event_id, participant_limit)
+                await conn.execute("""
+                    UPDATE event_instances
+                    SET participant_count=(
+                        SELECT COUNT(*) FROM event_registrations WHERE event_id=$1
+                    )
+                    WHERE id=$1
+                """, event_id)
 
             deleted = await conn.fetchrow("""
                 DELETE FROM event_users
@@ -476,6 +807,32 @@ async def delete_event_user_profile(guild_id: int, user_id: int):
             }
 
 
+async def get_registration_context(guild_id: int, user_id: int):
+    """Evento activo, inscripción, perfil y conteo en una sola consulta.
+
+    Cada columna es una fila completa de su tabla (o NULL), así que se lee igual
+    que el resultado de las consultas individuales.
+    """
+    async with bot_pool.acquire() as conn:
+        return await conn.fetchrow("""
+            WITH active AS (
+                SELECT id, participant_count
+                FROM event_instances
+                WHERE guild_id=$1 AND status IN ('open', 'closed')
+                ORDER BY id DESC
+                LIMIT 1
+            )
+            SELECT
+                (SELECT e FROM event_instances AS e WHERE e.id = (SELECT id FROM active)) AS event,
+                (
+                    SELECT r FROM event_registrations AS r
+                    WHERE r.event_id = (SELECT id FROM active) AND r.user_id=$2
+                ) AS registration,
+                (SELECT u FROM event_users AS u WHERE u.guild_id=$1 AND u.user_id=$2) AS profile,
+                COALESCE((SELECT participant_count FROM active), 0) AS participant_count
+        """, guild_id, user_id)
+
+
 async def get_event_registration(event_id: int, user_id: int):
     async with bot_pool.acquire() as conn:
         return await conn.fetchrow("""
@@ -487,7 +844,7 @@ async def get_event_registration(event_id: int, user_id: int):
 async def get_event_participant_count(event_id: int):
     async with bot_pool.acquire() as conn:
         return await conn.fetchval(
-            "SELECT COUNT(*) FROM event_registrations WHERE event_id=$1",
+            "SELECT COALESCE((SELECT participant_count FROM event_instances WHERE id=$1), 0)",
             event_id,
         )
 
@@ -500,88 +857,22 @@ async def register_event_participant(
     external_id: str | None,
     country: str | None,
 ):
+    # Toda la inscripción corre dentro de la función SQL homónima (ver init_db):
+    # el lock por guild dura una sola llamada al servidor.
     async with bot_pool.acquire() as conn:
-        async with conn.transaction():
-            await conn.execute("SELECT pg_advisory_xact_lock($1::bigint)", guild_id)
-            event = await conn.fetchrow("""
-                SELECT * FROM event_instances
-                WHERE guild_id=$1 AND status IN ('open', 'closed')
-                LIMIT 1
-                FOR UPDATE
-            """, guild_id)
-            if not event:
-                return "no_event", None
-            if event["status"] != "open":
-                return "closed", None
-
-            existing_registration = await conn.fetchrow("""
-                SELECT * FROM event_registrations
-                WHERE event_id=$1 AND user_id=$2
-            """, event["id"], user_id)
-            if existing_registration:
-                return "duplicate", existing_registration
-
-            profile = await conn.fetchrow("""
-                SELECT * FROM event_users WHERE guild_id=$1 AND user_id=$2
-            """, guild_id, user_id)
-            effective_external_id = (
-                profile["external_id"] if profile is not None else external_id
-            )
-            blacklisted = await conn.fetchval("""
-                SELECT EXISTS(
-                    SELECT 1 FROM event_blacklist
-                    WHERE guild_id=$1
-                      AND (external_id=$2 OR user_id=$3)
-                )
-            """, guild_id, effective_external_id, user_id)
-            if blacklisted:
-                return "blacklisted", None
-
-            if profile is None:
-                duplicate_external_id = await conn.fetchval("""
-                    SELECT EXISTS(
-                        SELECT 1 FROM event_users
-                        WHERE guild_id=$1 AND external_id=$2
-                    )
-                """, guild_id, external_id)
-                if duplicate_external_id:
-                    return "external_id_duplicate", None
-
-                profile = await conn.fetchrow("""
-                    INSERT INTO event_users (
-                        guild_id, user_id, discord_tag, nickname, external_id, country
-                    )
-                    VALUES ($1, $2, $3, $4, $5, $6)
-                    RETURNING *
-                """, guild_id, user_id, discord_tag, nickname, external_id, country)
-            else:
-                await conn.execute("""
-                    UPDATE event_users
-                    SET discord_tag=$3, updated_at=CURRENT_TIMESTAMP
-                    WHERE guild_id=$1 AND user_id=$2
-                """, guild_id, user_id, discord_tag)
-
-            participant_count = await conn.fetchval(
-                "SELECT COUNT(*) FROM event_registrations WHERE event_id=$1",
-                event["id"],
-            )
-            position = participant_count + 1
-            is_overflow = (
-                event["participant_limit"] > 0
-                and position > event["participant_limit"]
-            )
-            registration = await conn.fetchrow("""
-                INSERT INTO event_registrations (
-                    event_id, guild_id, user_id, position, is_overflow
-                )
-                VALUES ($1, $2, $3, $4, $5)
-                RETURNING *
-            """, event["id"], guild_id, user_id, position, is_overflow)
-            return "registered", {
-                "event": event,
-                "profile": profile,
-                "registration": registration,
-            }
+        row = await conn.fetchrow("""
+            SELECT * FROM register_event_participant($1, $2, $3, $4, $5, $6)
+        """, guild_id, user_id, discord_tag, nickname, external_id, country)
+    status = row["status"]
+    if status == "duplicate":
+        return status, row["registration"]
+    if status == "registered":
+        return status, {
+            "event": row["event"],
+            "profile": row["profile"],
+            "registration": row["registration"],
+        }
+    return status, None
 
 
 async def get_event_participants(event_id: int):
@@ -614,14 +905,48 @@ async def add_scheduled_post(guild_id, channel_id, title, content, attachment_ur
         return row["id"] if row else None
 
 
+async def add_scheduled_posts_bulk(posts):
+    """Inserta muchos posts en una sola sentencia y devuelve las filas creadas."""
+    async with bot_pool.acquire() as conn:
+        return await conn.fetch("""
+            INSERT INTO scheduled_posts (
+                guild_id, channel_id, title, content, attachment_urls,
+                scheduled_at, author_id, thread_name, recurrence
+            )
+            SELECT t.guild_id, t.channel_id, t.title, t.content,
+                   ARRAY(SELECT jsonb_array_elements_text(t.attachment_urls)),
+                   t.scheduled_at, t.author_id, t.thread_name, t.recurrence
+            FROM unnest(
+                $1::bigint[], $2::bigint[], $3::text[], $4::text[], $5::jsonb[],
+                $6::timestamptz[], $7::bigint[], $8::text[], $9::text[]
+            ) AS t(
+                guild_id, channel_id, title, content, attachment_urls,
+                scheduled_at, author_id, thread_name, recurrence
+            )
+            RETURNING *
+        """,
+            [post["guild_id"] for post in posts],
+            [post["channel_id"] for post in posts],
+            [post["title"] for post in posts],
+            [post["content"] for post in posts],
+            [json.dumps(post["attachment_urls"]) for post in posts],
+            [post["scheduled_at"] for post in posts],
+            [post["author_id"] for post in posts],
+            [post.get("thread_name") for post in posts],
+            [post.get("recurrence") for post in posts],
+        )
+
+
 async def get_scheduled_posts(guild_id):
     async with bot_pool.acquire() as conn:
         return await conn.fetch("SELECT * FROM scheduled_posts WHERE guild_id=$1 ORDER BY scheduled_at ASC", guild_id)
 
 
-async def delete_scheduled_post(post_id):
+async def delete_scheduled_post(post_id) -> bool:
+    """Devuelve True solo si esta llamada borró la fila, para liberar sus adjuntos una única vez."""
     async with bot_pool.acquire() as conn:
-        await conn.execute("DELETE FROM scheduled_posts WHERE id=$1", post_id)
+        deleted_id = await conn.fetchval("DELETE FROM scheduled_posts WHERE id=$1 RETURNING id", post_id)
+    return deleted_id is not None
 
 
 async def update_scheduled_post(post_id, title, content, attachment_urls, scheduled_at, thread_name=None):
@@ -632,33 +957,369 @@ async def update_scheduled_post(post_id, title, content, attachment_urls, schedu
                 content=$3,
                 attachment_urls=$4,
                 scheduled_at=$5,
-                thread_name=$6
+                thread_name=$6,
+                publish_attempts=0,
+                next_attempt_at=NULL,
+                last_error=NULL
             WHERE id=$1
             RETURNING *
         """, post_id, title, content, attachment_urls, scheduled_at, thread_name)
 
 
-async def get_expired_posts():
+async def claim_due_scheduled_posts(worker_id: str, lease_seconds: int, limit: int):
+    """Reclama posts vencidos para este worker.
+
+    SKIP LOCKED reparte las filas entre workers concurrentes y la lease vencida
+    permite recuperar los posts de un worker que se cayó a mitad de publicación.
+    """
     async with bot_pool.acquire() as conn:
-        return await conn.fetch("SELECT * FROM scheduled_posts WHERE scheduled_at <= NOW()")
+        return await conn.fetch("""
+            WITH claimable AS (
+                SELECT id
+                FROM scheduled_posts
+                WHERE COALESCE(next_attempt_at, scheduled_at) <= NOW()
+                  AND (claim_expires_at IS NULL OR claim_expires_at <= NOW())
+                ORDER BY COALESCE(next_attempt_at, scheduled_at), id
+                LIMIT $3
+                FOR UPDATE SKIP LOCKED
+            )
+            UPDATE scheduled_posts AS p
+            SET claimed_by = $1,
+                claim_expires_at = NOW() + $2 * INTERVAL '1 second'
+            FROM claimable
+            WHERE p.id = claimable.id
+            RETURNING p.*
+        """, worker_id, lease_seconds, limit)
 
 
-async def load_scheduled_posts(guild_id=None):
-    if bot_pool is None:
-        print("Cache de agendamientos no cargado: DB no disponible.")
-        return []
+async def extend_scheduled_post_claim(post_id: int, worker_id: str, lease_seconds: int) -> bool:
+    """Renueva la lease si el post sigue reclamado por este worker."""
+    async with bot_pool.acquire() as conn:
+        renewed = await conn.fetchval("""
+            UPDATE scheduled_posts
+            SET claim_expires_at = NOW() + $3 * INTERVAL '1 second'
+            WHERE id = $1 AND claimed_by = $2
+            RETURNING id
+        """, post_id, worker_id, lease_seconds)
+    return renewed is not None
+
 
+async def get_scheduled_post_due_times(post_ids):
+    """Devuelve id -> momento a partir del cual el post puede volver a reclamarse."""
     async with bot_pool.acquire() as conn:
-        if guild_id:
-            rows = await conn.fetch(
-                "SELECT * FROM scheduled_posts WHERE guild_id=$1 ORDER BY scheduled_at ASC",
-                guild_id
+        rows = await conn.fetch("""
+            SELECT id,
+                   GREATEST(
+                       COALESCE(next_attempt_at, scheduled_at),
+                       COALESCE(claim_expires_at, '-infinity')
+                   ) AS due_at
+            FROM scheduled_posts
+            WHERE id = ANY($1::int[])
+        """, list(post_ids))
+    return {row["id"]: row["due_at"] for row in rows}
+
+
+async def record_publish_failure(post_id, error: str, base_delay_seconds: int, max_delay_seconds: int, max_attempts: int):
+    """Suma un intento fallido con backoff exponencial.
+
+    Devuelve (fila, dead_lettered): si se agotaron los intentos, el post se mueve a
+    scheduled_posts_dead_letter y deja de publicarse.
+    """
+    async with bot_pool.acquire() as conn:
+        async with conn.transaction():
+            row = await conn.fetchrow("""
+                UPDATE scheduled_posts
+                SET publish_attempts = publish_attempts + 1,
+                    last_error = $2,
+                    next_attempt_at = NOW() + LEAST(
+                        $3::double precision * power(2, publish_attempts),
+                        $4::double precision
+                    ) * INTERVAL '1 second',
+                    claimed_by = NULL,
+                    claim_expires_at = NULL
+                WHERE id=$1
+                RETURNING *
+            """, post_id, error, base_delay_seconds, max_delay_seconds)
+            if row is None or row["publish_attempts"] < max_attempts:
+                return row, False
+            await conn.execute("""
+                WITH failed AS (
+                    DELETE FROM scheduled_posts WHERE id=$1 RETURNING *
+                )
+                INSERT INTO scheduled_posts_dead_letter (
+                    id, guild_id, channel_id, title, content, attachment_urls,
+                    scheduled_at, author_id, thread_name, publish_attempts, last_error, recurrence
+                )
+                SELECT id, guild_id, channel_id, title, content, attachment_urls,
+                       scheduled_at, author_id, thread_name, publish_attempts, last_error, recurrence
+                FROM failed
+                ON CONFLICT (id) DO UPDATE
+                SET publish_attempts = EXCLUDED.publish_attempts,
+                    last_error = EXCLUDED.last_error,
+                    failed_at = CURRENT_TIMESTAMP
+            """, post_id)
+            return row, True
+
+
+async def get_dead_letter_posts(guild_id, limit: int = 25):
+    async with bot_pool.acquire() as conn:
+        return await conn.fetch("""
+            SELECT *
+            FROM scheduled_posts_dead_letter
+            WHERE guild_id=$1
+            ORDER BY failed_at DESC
+            LIMIT $2
+        """, guild_id, limit)
+
+
+async def requeue_dead_letter_post(guild_id, post_id, scheduled_at):
+    """Devuelve un post fallido a scheduled_posts con el contador de intentos a cero."""
+    async with bot_pool.acquire() as conn:
+        return await conn.fetchrow("""
+            WITH failed AS (
+                DELETE FROM scheduled_posts_dead_letter
+                WHERE guild_id=$1 AND id=$2
+                RETURNING *
+            )
+            INSERT INTO scheduled_posts (
+                id, guild_id, channel_id, title, content, attachment_urls,
+                scheduled_at, author_id, thread_name, recurrence
+            )
+            SELECT id, guild_id, channel_id, title, content, attachment_urls,
+                   $3, author_id, thread_name, recurrence
+            FROM failed
+            RETURNING *
+        """, guild_id, post_id, scheduled_at)
+
+
+async def delete_dead_letter_post(guild_id, post_id):
+    async with bot_pool.acquire() as conn:
+        return await conn.fetchrow("""
+            DELETE FROM scheduled_posts_dead_letter
+            WHERE guild_id=$1 AND id=$2
+            RETURNING *
+        """, guild_id, post_id)
+
+
+async def set_scheduled_post_recurrence(guild_id, post_id, recurrence):
+    async with bot_pool.acquire() as conn:
+        return await conn.fetchrow("""
+            UPDATE scheduled_posts
+            SET recurrence=$3
+            WHERE guild_id=$1 AND id=$2
+            RETURNING *
+        """, guild_id, post_id, recurrence)
+
+
+async def reschedule_recurring_post(post_id, scheduled_at):
+    """Mueve un post recurrente a su próxima ocurrencia conservando contenido y adjuntos."""
+    async with bot_pool.acquire() as conn:
+        return await conn.fetchrow("""
+            UPDATE scheduled_posts
+            SET scheduled_at=$2,
+                publish_attempts=0,
+                next_attempt_at=NULL,
+                last_error=NULL,
+                claimed_by=NULL,
+                claim_expires_at=NULL
+            WHERE id=$1
+            RETURNING *
+        """, post_id, scheduled_at)
+
+
+async def get_scheduled_attachment_urls():
+    async with bot_pool.acquire() as conn:
+        rows = await conn.fetch("""
+            SELECT unnest(attachment_urls) AS url
+            FROM scheduled_posts
+            WHERE attachment_urls IS NOT NULL
+            UNION
+            SELECT unnest(attachment_urls) AS url
+            FROM scheduled_posts_dead_letter
+            WHERE attachment_urls IS NOT NULL
+        """)
+    return {row["url"] for row in rows}
+
+
+async def acquire_r2_object(key: str, size: int) -> str:
+    """Suma una referencia al objeto y devuelve su estado en R2.
+
+    "stored": el objeto ya está confirmado y no hace falta subirlo.
+    "upload": aún no está confirmado (también si otra subida idéntica sigue en
+    curso); quien lo recibe sube el objeto y lo confirma con mark_r2_object_uploaded.
+    "purging": su borrado está en curso; no se suma referencia y hay que subir
+    el contenido a una key propia.
+    """
+    async with bot_pool.acquire() as conn:
+        uploaded = await conn.fetchval("""
+            INSERT INTO r2_objects (key, size, ref_count, uploaded)
+            VALUES ($1, $2, 1, FALSE)
+            ON CONFLICT (key) DO UPDATE
+            SET ref_count = GREATEST(r2_objects.ref_count, 0) + 1
+            WHERE NOT r2_objects.purging
+            RETURNING uploaded
+        """, key, size)
+    if uploaded is None:
+        return "purging"
+    return "stored" if uploaded else "upload"
+
+
+async def mark_r2_object_uploaded(key: str):
+    async with bot_pool.acquire() as conn:
+        await conn.execute("UPDATE r2_objects SET uploaded = TRUE WHERE key = $1", key)
+
+
+async def release_r2_objects(keys, counts):
+    """Resta referencias y devuelve las keys que ya no tienen ninguna.
+
+    Las filas se conservan con conteo 0: solo claim_unreferenced_r2_objects
+    decide el borrado, así una subida idéntica puede reutilizarlas mientras tanto.
+    """
+    async with bot_pool.acquire() as conn:
+        rows = await conn.fetch("""
+            WITH released AS (
+                SELECT * FROM unnest($1::text[], $2::int[]) AS t(key, releases)
             )
+            UPDATE r2_objects AS o
+            SET ref_count = o.ref_count - released.releases
+            FROM released
+            WHERE o.key = released.key
+            RETURNING o.key, o.ref_count
+        """, list(keys), list(counts))
+    exhausted = [row["key"] for row in rows if row["ref_count"] <= 0]
+    # Objetos anteriores al conteo de referencias no tienen fila: se borran directamente.
+    tracked = {row["key"] for row in rows}
+    return exhausted + [key for key in keys if key not in tracked]
+
+
+async def claim_unreferenced_r2_objects(keys):
+    """Marca para borrar las keys sin referencias y devuelve las que se pueden borrar de R2.
+
+    Las keys sin fila reciben una fila en purging, para que una subida idéntica
+    concurrente no las reutilice mientras se borran.
+    """
+    async with bot_pool.acquire() as conn:
+        async with conn.transaction():
+            claimed = await conn.fetch("""
+                UPDATE r2_objects SET purging = TRUE
+                WHERE key = ANY($1::text[]) AND ref_count <= 0
+                RETURNING key
+            """, list(keys))
+            untracked = await conn.fetch("""
+                INSERT INTO r2_objects (key, ref_count, uploaded, purging)
+                SELECT key, 0, FALSE, TRUE FROM unnest($1::text[]) AS t(key)
+                ON CONFLICT (key) DO NOTHING
+                RETURNING key
+            """, list(keys))
+    return {row["key"] for row in claimed} | {row["key"] for row in untracked}
+
+
+async def claim_r2_objects_if_unchanged(keys, ref_counts):
+    """Marca para borrar las filas cuyo conteo sigue igual al leído; devuelve sus keys.
+
+    Si una subida idéntica sumó una referencia entretanto, la fila se conserva.
+    """
+    async with bot_pool.acquire() as conn:
+        rows = await conn.fetch("""
+            UPDATE r2_objects AS o SET purging = TRUE
+            FROM unnest($1::text[], $2::int[]) AS t(key, ref_count)
+            WHERE o.key = t.key AND o.ref_count = t.ref_count
+            RETURNING o.key
+        """, list(keys), list(ref_counts))
+    return {row["key"] for row in rows}
+
+
+async def finish_r2_object_purge(keys):
+    async with bot_pool.acquire() as conn:
+        await conn.execute(
+            "DELETE FROM r2_objects WHERE key = ANY($1::text[]) AND purging",
+            list(keys),
+        )
+
+
+async def abort_r2_object_purge(keys):
+    """Devuelve las filas al estado sin referencias para que la limpieza lo reintente.
+
+    El borrado pudo aplicarse a medias, así que una subida idéntica vuelve a subir el objeto.
+    """
+    async with bot_pool.acquire() as conn:
+        await conn.execute("""
+            UPDATE r2_objects SET purging = FALSE, uploaded = FALSE
+            WHERE key = ANY($1::text[]) AND purging
+        """, list(keys))
+
+
+async def get_tracked_r2_keys(keys=None):
+    async with bot_pool.acquire() as conn:
+        if keys is None:
+            rows = await conn.fetch("SELECT key FROM r2_objects")
         else:
             rows = await conn.fetch(
-                "SELECT * FROM scheduled_posts ORDER BY scheduled_at ASC"
+                "SELECT key FROM r2_objects WHERE key = ANY($1::text[])",
+                list(keys),
             )
+    return {row["key"] for row in rows}
+
+
+async def get_r2_objects_created_before(cutoff):
+    async with bot_pool.acquire() as conn:
+        return await conn.fetch(
+            "SELECT key, ref_count FROM r2_objects WHERE created_at < $1",
+            cutoff,
+        )
+
+
+async def get_expired_posts():
+    async with bot_pool.acquire() as conn:
+        return await conn.fetch("""
+            SELECT * FROM scheduled_posts
+            WHERE COALESCE(next_attempt_at, scheduled_at) <= NOW()
+            ORDER BY COALESCE(next_attempt_at, scheduled_at)
+        """)
+
+
+async def load_scheduled_posts(guild_id=None, window_seconds=None):
+    """Carga completos los posts que vencen dentro de la ventana y el resto como stubs livianos.
+
+    Un stub solo trae id, guild, canal, título y fechas; el contenido y los adjuntos
+    se hidratan con get_scheduled_posts_by_ids cuando el post entra en la ventana.
+    """
+    if bot_pool is None:
+        print("Cache de agendamientos no cargado: DB no disponible.")
+        return []
 
-    posts = [dict(r) for r in rows]
-    print(f"📦 Cache de agendamientos cargado: {len(posts)} post(s) pendiente(s).")
+    guild_filter = "AND guild_id=$2" if guild_id else ""
+    args = [window_seconds] + ([guild_id] if guild_id else [])
+    async with bot_pool.acquire() as conn:
+        full_rows = await conn.fetch(f"""
+            SELECT *
+            FROM scheduled_posts
+            WHERE ($1::double precision IS NULL
+                   OR COALESCE(next_attempt_at, scheduled_at) <= NOW() + $1 * INTERVAL '1 second')
+              {guild_filter}
+            ORDER BY scheduled_at ASC
+        """, *args)
+        stub_rows = []
+        if window_seconds is not None:
+            stub_rows = await conn.fetch(f"""
+                SELECT id, guild_id, channel_id, title, scheduled_at, next_attempt_at, recurrence
+                FROM scheduled_posts
+                WHERE COALESCE(next_attempt_at, scheduled_at) > NOW() + $1 * INTERVAL '1 second'
+                  {guild_filter}
+                ORDER BY scheduled_at ASC
+            """, *args)
+
+    posts = [dict(r) for r in full_rows] + [dict(r) for r in stub_rows]
+    print(
+        f"📦 Cache de agendamientos cargado: {len(posts)} post(s) pendiente(s) "
+        f"({len(full_rows)} completo(s), {len(stub_rows)} stub(s))."
+    )
     return posts
+
+
+async def get_scheduled_posts_by_ids(post_ids):
+    async with bot_pool.acquire() as conn:
+        return await conn.fetch(
+            "SELECT * FROM scheduled_posts WHERE id = ANY($1::int[])",
+            list(post_ids)
+        )
@@ -0,0 +1,40 @@
+import asyncio
+
+import aiohttp
+
+from core.config import HTTP_POOL_SIZE
+
+
+http_session: aiohttp.ClientSession | None = None
+
+
+async def open_http_session() -> aiohttp.ClientSession:
+    global http_session
+    if http_session is None or http_session.closed:
+        http_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=HTTP_POOL_SIZE, ttl_dns_cache=300),
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=60),
+        )
+    return http_session
+
+
+async def get_http_session() -> aiohttp.ClientSession:
+    return await open_http_session()
+
+
+async def close_http_session():
+    global http_session
+    if http_session is not None and not http_session.closed:
+        await http_session.close()
+    http_session = None
+
+
+async def gather_limited(items, worker, limit: int):
+    """Ejecuta ``worker`` sobre cada item con a lo sumo ``limit`` en paralelo, conservando el orden."""
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def run(item):
+        async with semaphore:
+            return await worker(item)
+
+    return await asyncio.gather(*(run(item) for item in items))
@@ -0,0 +1,113 @@
+import asyncio
+import io
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow es opcional: sin él los adjuntos se suben tal cual.
+    Image = None
+    ImageOps = None
+
+from core import metrics
+from core.config import (
+    IMAGE_MAX_DIMENSION,
+    IMAGE_MAX_INPUT_BYTES,
+    IMAGE_MIN_BYTES,
+    IMAGE_OUTPUT_FORMAT,
+    IMAGE_PROCESS_WORKERS,
+    IMAGE_PROCESSING_ENABLED,
+    IMAGE_QUALITY,
+    IMAGE_QUALITY_BY_GUILD,
+)
+
+
+PROCESSABLE_EXTENSIONS = frozenset({".png", ".jpg", ".jpeg", ".webp", ".bmp", ".tif", ".tiff"})
+OUTPUT_EXTENSIONS = {"WEBP": ".webp", "JPEG": ".jpg"}
+image_executor = None
+
+
+def image_processing_available() -> bool:
+    return IMAGE_PROCESSING_ENABLED and Image is not None
+
+
+def should_process_image(filename: str, size: int) -> bool:
+    return (
+        image_processing_available()
+        and Path(filename).suffix.lower() in PROCESSABLE_EXTENSIONS
+        and IMAGE_MIN_BYTES <= size <= IMAGE_MAX_INPUT_BYTES
+    )
+
+
+def guild_image_quality(guild_id) -> int:
+    return IMAGE_QUALITY_BY_GUILD.get(guild_id, IMAGE_QUALITY)
+
+
+def transcode_image(data: bytes, output_format: str, quality: int, max_dimension: int):
+    """Re-codifica la imagen sin metadatos. Se ejecuta en un proceso aparte."""
+    with Image.open(io.BytesIO(data)) as image:
+        if getattr(image, "is_animated", False):
+            return None
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+
+        if output_format == "JPEG":
+            if image.mode in ("RGBA", "LA", "P"):
+                image = image.convert("RGBA")
+                background = Image.new("RGB", image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel("A"))
+                image = background
+            elif image.mode != "RGB":
+                image = image.convert("RGB")
+            options = {"quality": quality, "optimize": True, "progressive": True}
+        else:
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA" if "A" in image.getbands() or image.mode == "P" else "RGB")
+            options = {"quality": quality, "method": 4}
+
+        output = io.BytesIO()
+        image.save(output, format=output_format, **options)
+    return output.getvalue()
+
+
+def get_image_executor() -> ProcessPoolExecutor:
+    global image_executor
+    if image_executor is None:
+        image_executor = ProcessPoolExecutor(max_workers=IMAGE_PROCESS_WORKERS)
+    return image_executor
+
+
+def shutdown_image_executor():
+    global image_executor
+    if image_executor is not None:
+        image_executor.shutdown(wait=False, cancel_futures=True)
+        image_executor = None
+
+
+async def optimize_image(data: bytes, filename: str, guild_id=None):
+    """Devuelve (bytes, filename) comprimidos, o los originales si no conviene re-codificar."""
+    if not should_process_image(filename, len(data)):
+        return data, filename
+
+    loop = asyncio.get_running_loop()
+    try:
+        result = await loop.run_in_executor(
+            get_image_executor(),
+            transcode_image,
+            data,
+            IMAGE_OUTPUT_FORMAT,
+            guild_image_quality(guild_id),
+            IMAGE_MAX_DIMENSION,
+        )
+    except Exception as e:
+        print(f"⚠️ No se pudo optimizar la imagen {filename}: {e}")
+        metrics.incr("images.failed")
+        return data, filename
+
+    if not result or len(result) >= len(data):
+        metrics.incr("images.skipped")
+        return data, filename
+
+    metrics.incr("images.optimized")
+    metrics.incr("images.bytes_saved", len(data) - len(result))
+    return result, str(Path(filename).with_suffix(OUTPUT_EXTENSIONS[IMAGE_OUTPUT_FORMAT]))
@@ -0,0 +1,28 @@
+COUNTERS = {}
+TIMINGS = {}
+
+
+def incr(name: str, value: int = 1):
+    COUNTERS[name] = COUNTERS.get(name, 0) + value
+
+
+def observe(name: str, seconds: float):
+    stats = TIMINGS.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0})
+    stats["count"] += 1
+    stats["total"] += seconds
+    stats["max"] = max(stats["max"], seconds)
+
+
+def timing_summary(name: str) -> str:
+    stats = TIMINGS.get(name)
+    if not stats or not stats["count"]:
+        return "sin datos"
+    average = stats["total"] / stats["count"]
+    return f"media {average:.2f}s, máx {stats['max']:.2f}s ({stats['count']} muestras)"
+
+
+def snapshot():
+    return {
+        "counters": dict(COUNTERS),
+        "timings": {name: dict(stats) for name, stats in TIMINGS.items()},
+    }
@@ -1,15 +1,32 @@
 import asyncio
+import functools
+import hashlib
+import tempfile
+import time
 import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import boto3
+from botocore.config import Config
 
+from core import database, metrics
+from core.attachment_cache import ATTACHMENT_CACHE
 from core.config import (
     R2_ACCESS_KEY,
     R2_BUCKET,
+    R2_CLEANUP_FLUSH_SECONDS,
+    R2_CLEANUP_MAX_ATTEMPTS,
+    R2_CONNECT_TIMEOUT_SECONDS,
+    R2_DEDUP_MAX_BYTES,
     R2_ENDPOINT,
+    R2_MAX_ATTEMPTS,
+    R2_MAX_WORKERS,
     R2_PUBLIC_URL,
+    R2_READ_TIMEOUT_SECONDS,
     R2_SECRET_KEY,
+    R2_UPLOAD_CHUNK_SIZE,
 )
 
 
@@ -19,32 +36,361 @@ r2_client = boto3.client(
     aws_access_key_id=R2_ACCESS_KEY,
     aws_secret_access_key=R2_SECRET_KEY,
     region_name="auto",
+    config=Config(
+        connect_timeout=R2_CONNECT_TIMEOUT_SECONDS,
+        read_timeout=R2_READ_TIMEOUT_SECONDS,
+        # El modo "standard" reintenta con backoff exponencial y jitter.
+        retries={"max_attempts": R2_MAX_ATTEMPTS, "mode": "standard"},
+        max_pool_connections=R2_MAX_WORKERS,
+    ),
 )
+R2_DELETE_BATCH_SIZE = 1000
+# Pool propio para que la lentitud de R2 no acapare el executor por defecto del loop.
+r2_executor = ThreadPoolExecutor(max_workers=R2_MAX_WORKERS, thread_name_prefix="r2")
 
 
-async def upload_to_r2(file_bytes: bytes, filename: str) -> str:
+async def run_r2(method, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(r2_executor, functools.partial(method, **kwargs))
+
+
+def shutdown_r2_executor():
+    r2_executor.shutdown(wait=False, cancel_futures=True)
+
+
+def r2_key_from_url(url: str) -> str:
+    return url.replace(f"{R2_PUBLIC_URL}/", "")
+
+
+def new_object_key(filename: str) -> str:
     ext = Path(filename).suffix
-    unique_key = f"adjuntos/{uuid.uuid4().hex}{ext}"
+    return f"adjuntos/{uuid.uuid4().hex}{ext}"
+
+
+class InFlightR2Keys:
+    """Cuenta las keys que el proceso usa y que aún no constan en la DB ni en una sesión.
+
+    Cubre subidas en curso e importaciones; la limpieza de huérfanos nunca las borra.
+    """
+
+    def __init__(self):
+        self._counts = Counter()
+
+    def keys(self):
+        return set(self._counts)
+
+    def hold(self, urls):
+        for url in urls or ():
+            self._counts[r2_key_from_url(url)] += 1
+
+    def release(self, urls):
+        for url in urls or ():
+            key = r2_key_from_url(url)
+            self._counts[key] -= 1
+            if self._counts[key] <= 0:
+                del self._counts[key]
+
 
-    loop = asyncio.get_event_loop()
-    await loop.run_in_executor(
-        None,
-        lambda: r2_client.put_object(
+R2_IN_FLIGHT = InFlightR2Keys()
+
+
+def content_object_key(digest: str, filename: str) -> str:
+    ext = Path(filename).suffix.lower()
+    return f"adjuntos/{digest}{ext}"
+
+
+async def iter_bytes_chunks(data: bytes, chunk_size: int = R2_UPLOAD_CHUNK_SIZE):
+    view = memoryview(data)
+    for start in range(0, len(view), chunk_size):
+        yield bytes(view[start:start + chunk_size])
+
+
+async def upload_stream_to_r2(chunks, filename: str, key: str | None = None) -> str:
+    """Sube un iterable asíncrono de bytes en partes de R2_UPLOAD_CHUNK_SIZE como máximo."""
+    unique_key = key or new_object_key(filename)
+    buffer = bytearray()
+    upload_id = None
+    parts = []
+
+    async def upload_part(body: bytes):
+        part_number = len(parts) + 1
+        response = await run_r2(
+            r2_client.upload_part,
             Bucket=R2_BUCKET,
             Key=unique_key,
-            Body=file_bytes,
+            UploadId=upload_id,
+            PartNumber=part_number,
+            Body=body,
         )
-    )
+        parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+
+    try:
+        async for chunk in chunks:
+            buffer.extend(chunk)
+            while len(buffer) >= R2_UPLOAD_CHUNK_SIZE:
+                if upload_id is None:
+                    response = await run_r2(
+                        r2_client.create_multipart_upload,
+                        Bucket=R2_BUCKET,
+                        Key=unique_key,
+                    )
+                    upload_id = response["UploadId"]
+                body = bytes(memoryview(buffer)[:R2_UPLOAD_CHUNK_SIZE])
+                del buffer[:R2_UPLOAD_CHUNK_SIZE]
+                await upload_part(body)
+
+        if upload_id is None:
+            body = bytes(buffer)
+            buffer.clear()
+            await run_r2(
+                r2_client.put_object,
+                Bucket=R2_BUCKET,
+                Key=unique_key,
+                Body=body,
+            )
+        else:
+            if buffer:
+                body = bytes(buffer)
+                buffer.clear()
+                await upload_part(body)
+            await run_r2(
+                r2_client.complete_multipart_upload,
+                Bucket=R2_BUCKET,
+                Key=unique_key,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": parts},
+            )
+    except BaseException:
+        if upload_id is not None:
+            try:
+                await run_r2(
+                    r2_client.abort_multipart_upload,
+                    Bucket=R2_BUCKET,
+                    Key=unique_key,
+                    UploadId=upload_id,
+                )
+            except Exception as e:
+                print(f"⚠️ No se pudo abortar la subida multipart a R2: {e}")
+        raise
     return f"{R2_PUBLIC_URL}/{unique_key}"
 
 
-async def delete_from_r2(url: str):
+async def read_spool(spool, chunk_size: int = R2_UPLOAD_CHUNK_SIZE):
+    await asyncio.to_thread(spool.seek, 0)
+    while chunk := await asyncio.to_thread(spool.read, chunk_size):
+        yield chunk
+
+
+async def upload_deduplicated_to_r2(chunks, filename: str) -> str:
+    """Sube por hash de contenido: bytes idénticos comparten un único objeto con conteo de referencias.
+
+    Los chunks se vuelcan a un archivo temporal (y a la cache local) mientras se
+    calcula el hash, y solo se suben a R2 si el contenido aún no está guardado.
+    Lo que supera R2_DEDUP_MAX_BYTES se sube a una key propia sin deduplicar.
+    """
+    if database.bot_pool is None:
+        return await upload_stream_to_r2(chunks, filename)
+
+    chunks = aiter(chunks)
+    digest = hashlib.sha256()
+    size = 0
+    oversized = None
+    held = None
+    spool = tempfile.SpooledTemporaryFile(max_size=R2_UPLOAD_CHUNK_SIZE)
+    cache_writer = await asyncio.to_thread(ATTACHMENT_CACHE.writer)
+
+    def spool_chunk(chunk: bytes):
+        spool.write(chunk)
+        cache_writer.write(chunk)
+
     try:
-        key = url.replace(f"{R2_PUBLIC_URL}/", "")
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(
-            None,
-            lambda: r2_client.delete_object(Bucket=R2_BUCKET, Key=key)
-        )
-    except Exception as e:
-        print(f"⚠️ No se pudo borrar objeto de R2: {e}")
+        async for chunk in chunks:
+            size += len(chunk)
+            if size > R2_DEDUP_MAX_BYTES:
+                oversized = chunk
+                break
+            digest.update(chunk)
+            await asyncio.to_thread(spool_chunk, chunk)
+
+        if oversized is not None:
+            async def remaining_chunks():
+                async for spooled in read_spool(spool):
+                    yield spooled
+                yield oversized
+                async for rest in chunks:
+                    yield rest
+
+            return await upload_stream_to_r2(remaining_chunks(), filename)
+
+        key = content_object_key(digest.hexdigest(), filename)
+        held = f"{R2_PUBLIC_URL}/{key}"
+        R2_IN_FLIGHT.hold([held])
+        status = await database.acquire_r2_object(key, size)
+        if status == "stored":
+            metrics.incr("attachments.dedup_hit")
+            metrics.incr("attachments.dedup_bytes_saved", size)
+        elif status == "purging":
+            # La key se está borrando: este contenido queda en una key propia sin conteo.
+            key = new_object_key(filename)
+            await upload_stream_to_r2(read_spool(spool), filename, key=key)
+        else:
+            try:
+                await upload_stream_to_r2(read_spool(spool), filename, key=key)
+                await database.mark_r2_object_uploaded(key)
+            except BaseException:
+                await database.release_r2_objects([key], [1])
+                raise
+        await asyncio.to_thread(cache_writer.commit, key)
+        return f"{R2_PUBLIC_URL}/{key}"
+    finally:
+        await asyncio.to_thread(cache_writer.discard)
+        await asyncio.to_thread(spool.close)
+        # Sin await después: quien llama registra la URL antes de ceder el loop.
+        R2_IN_FLIGHT.release([held] if held else ())
+
+
+async def list_r2_objects(prefix: str = "adjuntos/"):
+    """Recorre el bucket página a página sin cargar el listado completo en memoria."""
+    continuation_token = None
+    while True:
+        kwargs = {"Bucket": R2_BUCKET, "Prefix": prefix, "MaxKeys": 1000}
+        if continuation_token:
+            kwargs["ContinuationToken"] = continuation_token
+        response = await run_r2(r2_client.list_objects_v2, **kwargs)
+        for item in response.get("Contents", []):
+            yield item
+        if not response.get("IsTruncated"):
+            return
+        continuation_token = response.get("NextContinuationToken")
+
+
+async def delete_many_from_r2(keys) -> list[str]:
+    """Borra keys en lotes de DeleteObjects y devuelve las que no se pudieron borrar."""
+    keys = list(dict.fromkeys(keys))
+    failed = []
+    for start in range(0, len(keys), R2_DELETE_BATCH_SIZE):
+        batch = keys[start:start + R2_DELETE_BATCH_SIZE]
+        await ATTACHMENT_CACHE.evict_many_async(batch)
+        try:
+            response = await run_r2(
+                r2_client.delete_objects,
+                Bucket=R2_BUCKET,
+                Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True},
+            )
+        except Exception as e:
+            print(f"⚠️ No se pudo borrar un lote de {len(batch)} objeto(s) de R2: {e}")
+            failed.extend(batch)
+            continue
+        for error in response.get("Errors", []):
+            print(f"⚠️ R2 rechazó borrar {error.get('Key')}: {error.get('Code')} {error.get('Message')}")
+            failed.append(error["Key"])
+    return failed
+
+
+async def purge_r2_objects(keys) -> list[str]:
+    """Borra de R2 keys ya reclamadas para purga y elimina sus filas; devuelve las que fallaron."""
+    failed = await delete_many_from_r2(keys)
+    failed_keys = set(failed)
+    deleted = [key for key in keys if key not in failed_keys]
+    if deleted:
+        await database.finish_r2_object_purge(deleted)
+    return failed
+
+
+class R2CleanupQueue:
+    """Agrupa las liberaciones de adjuntos y borra en lotes los objetos sin referencias."""
+
+    def __init__(self, flush_interval: float, max_attempts: int):
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self._releases = {}
+        self._deletes = {}
+        self._task = None
+
+    def __len__(self):
+        return len(self._releases) + len(self._deletes)
+
+    def pending_keys(self):
+        return set(self._releases) | set(self._deletes)
+
+    def enqueue(self, urls, delay: float = 0):
+        not_before = time.monotonic() + delay
+        for url in urls or ():
+            entry = self._releases.setdefault(r2_key_from_url(url), [not_before, 0])
+            entry[0] = max(entry[0], not_before)
+            entry[1] += 1
+
+    async def release_due(self, now: float, force: bool):
+        # Sin DB no se puede saber si otro post comparte el objeto: se espera.
+        if database.bot_pool is None:
+            return
+        due = {
+            key: count for key, (not_before, count) in self._releases.items()
+            if force or not_before <= now
+        }
+        if not due:
+            return
+        for key in due:
+            del self._releases[key]
+        try:
+            unreferenced = await database.release_r2_objects(list(due), list(due.values()))
+        except Exception as e:
+            print(f"⚠️ No se pudieron liberar {len(due)} referencia(s) de R2: {e}")
+            retry_at = now + self.flush_interval
+            for key, count in due.items():
+                entry = self._releases.setdefault(key, [retry_at, 0])
+                entry[1] += count
+            return
+        for key in unreferenced:
+            self._deletes.setdefault(key, [now, 0])
+
+    async def flush(self, force: bool = False):
+        now = time.monotonic()
+        await self.release_due(now, force)
+        due = [
+            key for key, (not_before, _) in self._deletes.items()
+            if force or not_before <= now
+        ]
+        if not due or database.bot_pool is None:
+            return
+        # La misma consulta que comprueba el conteo marca las filas en purging: una
+        # subida idéntica posterior ya no reutiliza la key mientras se borra.
+        # Si la consulta falla, las keys siguen en la cola para el próximo flush.
+        claimed = await database.claim_unreferenced_r2_objects(due)
+        attempts_by_key = {
+            key: self._deletes.pop(key)[1] for key in due if key in self._deletes
+        }
+        due = [key for key in attempts_by_key if key in claimed]
+        failed = await purge_r2_objects(due)
+        discarded = []
+        for key in failed:
+            attempts = attempts_by_key.get(key, 0) + 1
+            if attempts >= self.max_attempts:
+                print(f"❌ Se descarta el borrado de {key} en R2 tras {attempts} intento(s).")
+                discarded.append(key)
+                continue
+            retry_at = time.monotonic() + self.flush_interval * (2 ** attempts)
+            self._deletes[key] = [retry_at, attempts]
+        if discarded:
+            await database.abort_r2_object_purge(discarded)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"⚠️ Error vaciando la cola de borrado de R2: {e}")
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush(force=True)
+
+
+R2_CLEANUP_QUEUE = R2CleanupQueue(R2_CLEANUP_FLUSH_SECONDS, R2_CLEANUP_MAX_ATTEMPTS)
@@ -0,0 +1,184 @@
+import functools
+from datetime import datetime, time, timedelta
+
+from core.config import TZ_BRASILIA
+
+
+WEEKDAY_KEYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+WEEKDAY_LABELS = ("lun", "mar", "mié", "jue", "vie", "sáb", "dom")
+WEEKDAY_ALIASES = {
+    **{key: index for index, key in enumerate(WEEKDAY_KEYS)},
+    **{label: index for index, label in enumerate(WEEKDAY_LABELS)},
+    "mie": 2,
+    "sab": 5,
+}
+CRON_FIELDS = (
+    ("minuto", 0, 59),
+    ("hora", 0, 23),
+    ("día del mes", 1, 31),
+    ("mes", 1, 12),
+    ("día de la semana", 0, 7),
+)
+# Suficiente para cualquier expresión válida (p. ej. 29 de febrero en lunes).
+CRON_SEARCH_DAYS = 366 * 28
+
+
+def _cron_int(text: str, name: str, part: str) -> int:
+    try:
+        return int(text)
+    except ValueError:
+        raise ValueError(f"Valor inválido en {name}: {part}") from None
+
+
+def _parse_cron_field(value: str, name: str, low: int, high: int) -> frozenset:
+    values = set()
+    for part in value.split(","):
+        base, _, step_text = part.partition("/")
+        step = _cron_int(step_text, name, part) if step_text else 1
+        if step < 1:
+            raise ValueError(f"Paso inválido en {name}: {part}")
+        if base == "*":
+            start, end = low, high
+        elif "-" in base:
+            start_text, _, end_text = base.partition("-")
+            start, end = _cron_int(start_text, name, part), _cron_int(end_text, name, part)
+        else:
+            start = end = _cron_int(base, name, part)
+            if step_text:
+                end = high
+        if not (low <= start <= end <= high):
+            raise ValueError(f"Valor fuera de rango en {name}: {part}")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+def _parse_weekdays(value: str) -> frozenset:
+    days = set()
+    for item in value.split(","):
+        item = item.strip().lower()
+        if item not in WEEKDAY_ALIASES:
+            raise ValueError(f"Día de la semana desconocido: {item}")
+        days.add(WEEKDAY_ALIASES[item])
+    if not days:
+        raise ValueError("Indica al menos un día de la semana.")
+    return frozenset(days)
+
+
+def parse_recurrence(text: str | None) -> str | None:
+    """Normaliza una regla escrita por el staff; devuelve None para quitar la recurrencia.
+
+    Formatos: ``diario``, ``semanal:lun,mie,vie`` y ``cron:<min> <hora> <día> <mes> <día_semana>``.
+    Lanza ValueError si la regla no es válida.
+    """
+    text = (text or "").strip()
+    kind, _, value = text.partition(":")
+    kind = kind.strip().lower()
+    if kind in ("", "no", "ninguna", "none"):
+        return None
+    if kind in ("diario", "daily"):
+        return "daily"
+    if kind in ("semanal", "weekly"):
+        days = _parse_weekdays(value)
+        return "weekly:" + ",".join(WEEKDAY_KEYS[day] for day in sorted(days))
+    if kind == "cron":
+        fields = value.split()
+        if len(fields) != len(CRON_FIELDS):
+            raise ValueError("Una expresión cron necesita 5 campos: minuto hora día mes día_semana.")
+        for field, (name, low, high) in zip(fields, CRON_FIELDS):
+            _parse_cron_field(field, name, low, high)
+        rule = "cron:" + " ".join(fields)
+        # Rechaza expresiones que nunca se cumplen (p. ej. 31 de febrero) antes de guardarlas.
+        now = datetime.now(TZ_BRASILIA)
+        try:
+            next_occurrence(rule, now, now)
+        except ValueError:
+            raise ValueError(f"La expresión cron `{value.strip()}` nunca se cumple.") from None
+        return rule
+    raise ValueError(f"Regla de recurrencia desconocida: {text}")
+
+
+@functools.lru_cache(maxsize=256)
+def _compile(rule: str):
+    kind, _, value = rule.partition(":")
+    if kind == "daily":
+        return "weekly", frozenset(range(7))
+    if kind == "weekly":
+        return "weekly", _parse_weekdays(value)
+    if kind == "cron":
+        fields = value.split()
+        minutes, hours, days, months, weekdays = (
+            _parse_cron_field(field, name, low, high)
+            for field, (name, low, high) in zip(fields, CRON_FIELDS)
+        )
+        return "cron", (
+            tuple(sorted(minutes)),
+            tuple(sorted(hours)),
+            days,
+            months,
+            # cron: 0 y 7 son domingo; datetime.weekday(): lunes es 0.
+            frozenset((day - 1) % 7 for day in weekdays),
+            fields[2] != "*",
+            fields[4] != "*",
+        )
+    raise ValueError(f"Regla de recurrencia desconocida: {rule}")
+
+
+def _next_weekly(weekdays, anchor: datetime, after: datetime) -> datetime:
+    anchor_local = anchor.astimezone(TZ_BRASILIA)
+    time_of_day = time(anchor_local.hour, anchor_local.minute)
+    start = after.astimezone(TZ_BRASILIA).date()
+    for offset in range(8):
+        day = start + timedelta(days=offset)
+        if day.weekday() not in weekdays:
+            continue
+        candidate = datetime.combine(day, time_of_day, tzinfo=TZ_BRASILIA)
+        if candidate > after:
+            return candidate
+    raise ValueError("La regla semanal no tiene días.")
+
+
+def _next_cron(spec, after: datetime) -> datetime:
+    minutes, hours, days, months, weekdays, days_restricted, weekdays_restricted = spec
+    start = (after.astimezone(TZ_BRASILIA) + timedelta(minutes=1)).replace(second=0, microsecond=0)
+    start_naive = start.replace(tzinfo=None)
+    for offset in range(CRON_SEARCH_DAYS):
+        day = start.date() + timedelta(days=offset)
+        if day.month not in months:
+            continue
+        day_match = day.day in days
+        weekday_match = day.weekday() in weekdays
+        if days_restricted and weekdays_restricted:
+            matches = day_match or weekday_match
+        else:
+            matches = day_match and weekday_match
+        if not matches:
+            continue
+        for hour in hours:
+            for minute in minutes:
+                candidate = datetime(day.year, day.month, day.day, hour, minute)
+                if candidate >= start_naive:
+                    return candidate.replace(tzinfo=TZ_BRASILIA)
+    raise ValueError("La expresión cron no tiene próximas ocurrencias.")
+
+
+def next_occurrence(rule: str, anchor: datetime, after: datetime) -> datetime:
+    """Próxima ocurrencia posterior a ``after`` en TZ_BRASILIA.
+
+    ``anchor`` es la fecha original del post: las reglas diaria y semanal conservan su hora.
+    """
+    kind, spec = _compile(rule)
+    if kind == "weekly":
+        return _next_weekly(spec, anchor, after)
+    return _next_cron(spec, after)
+
+
+def describe_recurrence(rule: str | None) -> str:
+    if not rule:
+        return "Sin repetición"
+    kind, _, value = rule.partition(":")
+    if kind == "daily":
+        return "Todos los días"
+    if kind == "weekly":
+        days = _parse_weekdays(value)
+        return "Cada " + ", ".join(WEEKDAY_LABELS[day] for day in sorted(days))
+    return f"Cron `{value}`"
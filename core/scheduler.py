@@ -0,0 +1,96 @@
+import asyncio
+import heapq
+import itertools
+from datetime import datetime, timedelta, timezone
+
+
+MAX_SLEEP_SECONDS = 3600
+RETRY_BASE_SECONDS = 1
+RETRY_MAX_SECONDS = 60
+
+
+class DeadlineScheduler:
+    """Cola de vencimientos (min-heap) que duerme hasta el próximo deadline."""
+
+    def __init__(self):
+        self._heap = []
+        self._deadlines = {}
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._failures = 0
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def __contains__(self, key):
+        return key in self._deadlines
+
+    def schedule(self, key, deadline: datetime):
+        if deadline.tzinfo is None:
+            deadline = deadline.replace(tzinfo=timezone.utc)
+        head = self.next_deadline()
+        self._deadlines[key] = deadline
+        heapq.heappush(self._heap, (deadline, next(self._counter), key))
+        if head is None or deadline < head:
+            self._wakeup.set()
+
+    def cancel(self, key):
+        # Las entradas del heap se descartan de forma perezosa.
+        self._deadlines.pop(key, None)
+
+    def clear(self):
+        self._heap.clear()
+        self._deadlines.clear()
+        self._wakeup.set()
+
+    def next_deadline(self):
+        while self._heap:
+            deadline, _, key = self._heap[0]
+            if self._deadlines.get(key) == deadline:
+                return deadline
+            heapq.heappop(self._heap)
+        return None
+
+    def pop_due(self, now: datetime | None = None):
+        now = now or datetime.now(timezone.utc)
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, _, key = heapq.heappop(self._heap)
+            if self._deadlines.get(key) == deadline:
+                del self._deadlines[key]
+                due.append(key)
+        return due
+
+    async def wait(self):
+        self._wakeup.clear()
+        deadline = self.next_deadline()
+        timeout = MAX_SLEEP_SECONDS
+        if deadline is not None:
+            remaining = (deadline - datetime.now(timezone.utc)).total_seconds()
+            timeout = min(max(remaining, 0.0), MAX_SLEEP_SECONDS)
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def run(self, callback):
+        while True:
+            due = self.pop_due()
+            if due:
+                try:
+                    await callback(due)
+                    self._failures = 0
+                except Exception as e:
+                    self.retry_later(due)
+                    print(f"❌ Error procesando vencimientos del scheduler: {e}")
+            await self.wait()
+
+    def retry_later(self, keys):
+        # Los ids ya salieron del heap: se reencolan con backoff salvo que el
+        # callback los haya reagendado antes de fallar.
+        self._failures += 1
+        delay = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** (self._failures - 1))
+        retry_at = datetime.now(timezone.utc) + timedelta(seconds=delay)
+        for key in keys:
+            if key not in self._deadlines:
+                self.schedule(key, retry_at)
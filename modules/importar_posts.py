@@ -0,0 +1,380 @@
+import asyncio
+import csv
+import io
+import json
+import threading
+import zipfile
+from datetime import datetime
+from pathlib import PurePosixPath
+from urllib.parse import urlparse
+
+import discord
+from discord import app_commands
+
+from core import metrics
+from core.config import (
+    ATTACHMENT_TRANSFER_CONCURRENCY,
+    R2_STREAM_READ_SIZE,
+    TZ_BRASILIA,
+    db_unavailable,
+    require_staff,
+)
+from core.database import add_scheduled_posts_bulk
+from core.http_client import gather_limited, get_http_session
+from core.image_processing import optimize_image
+from core.r2_storage import R2_IN_FLIGHT, iter_bytes_chunks, upload_deduplicated_to_r2
+from core.recurrence import parse_recurrence
+from modules import posts
+
+
+IMPORT_MAX_POSTS = 200
+IMPORT_MAX_ATTACHMENTS_PER_POST = 10
+IMPORT_MAX_UNCOMPRESSED_BYTES = 512 * 1024 * 1024
+# El archivo subido (CSV, JSON o zip con adjuntos) se lee entero en memoria.
+IMPORT_MAX_MANIFEST_BYTES = 100 * 1024 * 1024
+# Límite de subida de Discord sin boosts: un adjunto mayor no se podría publicar.
+IMPORT_MAX_ATTACHMENT_BYTES = 25 * 1024 * 1024
+IMPORT_ZIP_READ_SIZE = 1024 * 1024
+IMPORT_URL_HOSTS = frozenset({"cdn.discordapp.com", "media.discordapp.net"})
+IMPORT_MAX_ERRORS_SHOWN = 15
+IMPORT_MANIFEST_NAMES = ("posts.json", "posts.csv")
+IMPORT_DATE_FORMAT = "%d/%m/%Y %H:%M"
+IMPORT_FIELD_ALIASES = {
+    "canal": "canal", "channel": "canal", "channel_id": "canal",
+    "titulo": "titulo", "título": "titulo", "title": "titulo", "nombre": "titulo",
+    "contenido": "contenido", "content": "contenido",
+    "fecha": "fecha", "scheduled_at": "fecha",
+    "hilo": "hilo", "thread_name": "hilo",
+    "repetir": "repetir", "recurrence": "repetir",
+    "adjuntos": "adjuntos", "attachments": "adjuntos",
+}
+
+
+class PostImportError(Exception):
+    pass
+
+
+class DecompressionBudget:
+    """Cuenta los bytes realmente descomprimidos: los tamaños que declara el zip no son fiables."""
+
+    def __init__(self, limit: int):
+        self.remaining = limit
+        self._lock = threading.Lock()
+
+    def consume(self, size: int):
+        with self._lock:
+            self.remaining -= size
+            if self.remaining < 0:
+                raise PostImportError("El zip descomprimido es demasiado grande.")
+
+
+def read_zip_member(archive, name: str, budget: DecompressionBudget, max_bytes: int) -> bytes:
+    """Descomprime un miembro en bloques acotados. Bloquea: llamar fuera del loop."""
+    data = bytearray()
+    with archive.open(name) as member:
+        while chunk := member.read(IMPORT_ZIP_READ_SIZE):
+            budget.consume(len(chunk))
+            data.extend(chunk)
+            if len(data) > max_bytes:
+                raise PostImportError(f"`{name}` supera {max_bytes // (1024 * 1024)} MB.")
+    return bytes(data)
+
+
+def is_allowed_import_url(url: str) -> bool:
+    parsed = urlparse(url)
+    return parsed.scheme == "https" and parsed.hostname in IMPORT_URL_HOSTS
+
+
+async def limit_chunks(chunks, max_bytes: int, name: str):
+    size = 0
+    async for chunk in chunks:
+        size += len(chunk)
+        if size > max_bytes:
+            raise PostImportError(f"`{name}` supera {max_bytes // (1024 * 1024)} MB.")
+        yield chunk
+
+
+def normalize_record(record: dict) -> dict:
+    normalized = {}
+    for key, value in record.items():
+        field = IMPORT_FIELD_ALIASES.get(str(key or "").strip().lower())
+        if field is not None:
+            normalized[field] = value
+    return normalized
+
+
+def read_manifest(filename: str, data: bytes, budget: DecompressionBudget):
+    """Devuelve (registros, zip o None) a partir de un CSV, un JSON o un zip con uno de ellos.
+
+    Bloquea al descomprimir: llamar fuera del loop.
+    """
+    suffix = PurePosixPath(filename.lower()).suffix
+    if suffix == ".zip":
+        try:
+            archive = zipfile.ZipFile(io.BytesIO(data))
+        except zipfile.BadZipFile as e:
+            raise PostImportError(f"El zip no es válido: {e}")
+        if sum(info.file_size for info in archive.infolist()) > IMPORT_MAX_UNCOMPRESSED_BYTES:
+            raise PostImportError("El zip descomprimido es demasiado grande.")
+        names = {PurePosixPath(name).name.lower(): name for name in archive.namelist()}
+        for manifest in IMPORT_MANIFEST_NAMES:
+            if manifest in names:
+                content = read_zip_member(archive, names[manifest], budget, IMPORT_MAX_ATTACHMENT_BYTES)
+                records, _ = read_manifest(manifest, content, budget)
+                return records, archive
+        raise PostImportError("El zip debe incluir un `posts.json` o `posts.csv`.")
+
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise PostImportError("El archivo debe estar en UTF-8.")
+    if suffix == ".json":
+        try:
+            records = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise PostImportError(f"JSON inválido: {e}")
+        if isinstance(records, dict):
+            records = records.get("posts", [])
+        if not isinstance(records, list) or not all(isinstance(item, dict) for item in records):
+            raise PostImportError("El JSON debe ser una lista de objetos (o `{\"posts\": [...]}`).")
+        return records, None
+    if suffix == ".csv":
+        return list(csv.DictReader(io.StringIO(text))), None
+    raise PostImportError("Formato no soportado. Usa `.csv`, `.json` o `.zip`.")
+
+
+def resolve_channel(guild: discord.Guild, value):
+    text = str(value or "").strip()
+    if text.startswith("<#") and text.endswith(">"):
+        text = text[2:-1]
+    if text.isdigit():
+        channel = guild.get_channel(int(text))
+    else:
+        channel = discord.utils.get(guild.text_channels, name=text.lstrip("#"))
+    return channel if isinstance(channel, discord.abc.Messageable) else None
+
+
+def parse_import_date(value):
+    text = str(value or "").strip()
+    try:
+        scheduled_at = datetime.strptime(text, IMPORT_DATE_FORMAT)
+    except ValueError:
+        scheduled_at = datetime.fromisoformat(text)
+    if scheduled_at.tzinfo is None:
+        scheduled_at = scheduled_at.replace(tzinfo=TZ_BRASILIA)
+    return scheduled_at
+
+
+def split_attachments(value):
+    if isinstance(value, list):
+        return [str(item).strip() for item in value if str(item).strip()]
+    return [item.strip() for item in str(value or "").replace(";", "|").split("|") if item.strip()]
+
+
+def validate_records(records, guild: discord.Guild, archive):
+    """Valida todas las filas antes de subir nada; devuelve (posts, errores)."""
+    archive_names = {}
+    if archive is not None:
+        for name in archive.namelist():
+            archive_names.setdefault(name, name)
+            archive_names.setdefault(PurePosixPath(name).name, name)
+
+    now = datetime.now(TZ_BRASILIA)
+    parsed, errors = [], []
+    for number, raw in enumerate(records, 1):
+        record = normalize_record(raw)
+        row_errors = []
+
+        channel = resolve_channel(guild, record.get("canal"))
+        if channel is None:
+            row_errors.append(f"canal `{record.get('canal')}` no encontrado")
+
+        title = str(record.get("titulo") or "").strip()
+        if not title:
+            row_errors.append("falta el título")
+        elif len(title) > 100:
+            row_errors.append("el título supera 100 caracteres")
+
+        content = str(record.get("contenido") or "")
+        if len(content) > 2000:
+            row_errors.append("el contenido supera 2000 caracteres")
+
+        scheduled_at = None
+        try:
+            scheduled_at = parse_import_date(record.get("fecha"))
+            if scheduled_at <= now:
+                row_errors.append("la fecha debe ser futura")
+        except ValueError:
+            row_errors.append(f"fecha `{record.get('fecha')}` inválida (usa DD/MM/AAAA HH:MM)")
+
+        thread_name = str(record.get("hilo") or "").strip() or None
+        if thread_name and len(thread_name) > 100:
+            row_errors.append("el nombre del hilo supera 100 caracteres")
+
+        recurrence = None
+        try:
+            recurrence = parse_recurrence(record.get("repetir"))
+        except ValueError as e:
+            row_errors.append(str(e))
+
+        attachments = []
+        for item in split_attachments(record.get("adjuntos")):
+            if item.startswith(("https://", "http://")):
+                if not is_allowed_import_url(item):
+                    row_errors.append(f"adjunto `{item}`: solo se aceptan enlaces https del CDN de Discord")
+                    continue
+                attachments.append(("url", item, PurePosixPath(item.split("?")[0]).name))
+            elif item in archive_names:
+                attachments.append(("zip", archive_names[item], PurePosixPath(item).name))
+            else:
+                row_errors.append(f"adjunto `{item}` no está en el zip")
+        if len(attachments) > IMPORT_MAX_ATTACHMENTS_PER_POST:
+            row_errors.append(f"más de {IMPORT_MAX_ATTACHMENTS_PER_POST} adjuntos")
+        if not content and not attachments:
+            row_errors.append("sin contenido ni adjuntos")
+
+        if row_errors:
+            errors.append(f"Fila {number}: " + "; ".join(row_errors))
+            continue
+        parsed.append({
+            "channel_id": channel.id,
+            "title": title,
+            "content": content,
+            "scheduled_at": scheduled_at,
+            "thread_name": thread_name,
+            "recurrence": recurrence,
+            "attachments": attachments,
+        })
+    return parsed, errors
+
+
+async def upload_import_attachment(session, archive, budget, guild_id, attachment):
+    source, location, filename = attachment
+    if source == "zip":
+        data = await asyncio.to_thread(
+            read_zip_member, archive, location, budget, IMPORT_MAX_ATTACHMENT_BYTES
+        )
+        data, filename = await optimize_image(data, filename, guild_id)
+        return await upload_deduplicated_to_r2(iter_bytes_chunks(data), filename)
+
+    # Sin redirecciones: el host ya validado es el único que se contacta.
+    async with session.get(location, allow_redirects=False) as resp:
+        if resp.status != 200:
+            raise RuntimeError(f"status {resp.status} descargando {location}")
+        if resp.content_length is not None and resp.content_length > IMPORT_MAX_ATTACHMENT_BYTES:
+            raise PostImportError(f"`{filename}` supera {IMPORT_MAX_ATTACHMENT_BYTES // (1024 * 1024)} MB.")
+        chunks = limit_chunks(
+            resp.content.iter_chunked(R2_STREAM_READ_SIZE), IMPORT_MAX_ATTACHMENT_BYTES, filename
+        )
+        return await upload_deduplicated_to_r2(chunks, filename)
+
+
+async def import_posts(interaction: discord.Interaction, archivo: discord.Attachment):
+    if archivo.size > IMPORT_MAX_MANIFEST_BYTES:
+        raise PostImportError(f"El archivo supera {IMPORT_MAX_MANIFEST_BYTES // (1024 * 1024)} MB.")
+    data = await archivo.read()
+    budget = DecompressionBudget(IMPORT_MAX_UNCOMPRESSED_BYTES)
+    records, archive = await asyncio.to_thread(read_manifest, archivo.filename, data, budget)
+    if not records:
+        raise PostImportError("El archivo no contiene publicaciones.")
+    if len(records) > IMPORT_MAX_POSTS:
+        raise PostImportError(f"Máximo {IMPORT_MAX_POSTS} publicaciones por importación.")
+
+    parsed, errors = validate_records(records, interaction.guild, archive)
+    if errors:
+        shown = "\n".join(errors[:IMPORT_MAX_ERRORS_SHOWN])
+        extra = len(errors) - IMPORT_MAX_ERRORS_SHOWN
+        if extra > 0:
+            shown += f"\n… y {extra} error(es) más."
+        raise PostImportError(f"No se importó nada. Corrige estos errores:\n{shown}")
+
+    # Cada referencia se sube por separado: la deduplicación de R2 comparte los bytes
+    # y lleva la cuenta de referencias por post.
+    session = await get_http_session()
+    references = [
+        (index, attachment)
+        for index, post in enumerate(parsed)
+        for attachment in post["attachments"]
+    ]
+
+    held = []
+
+    async def upload(reference):
+        try:
+            url = await upload_import_attachment(
+                session, archive, budget, interaction.guild_id, reference[1]
+            )
+        except Exception as e:
+            print(f"⚠️ Error subiendo adjunto importado {reference[1][1]}: {e}")
+            return None
+        # Hasta que las filas existan, la limpieza de huérfanos no las ve en la DB.
+        R2_IN_FLIGHT.hold([url])
+        held.append(url)
+        return url
+
+    try:
+        urls = await gather_limited(references, upload, ATTACHMENT_TRANSFER_CONCURRENCY)
+        uploaded = [url for url in urls if url]
+        if len(uploaded) != len(references):
+            await posts.cleanup_r2_now(uploaded)
+            raise PostImportError(f"Falló la subida de {len(references) - len(uploaded)} adjunto(s). No se importó nada.")
+
+        attachment_urls = [[] for _ in parsed]
+        for (index, _), url in zip(references, urls):
+            attachment_urls[index].append(url)
+
+        rows = [
+            {
+                "guild_id": interaction.guild_id,
+                "channel_id": post["channel_id"],
+                "title": post["title"],
+                "content": post["content"],
+                "attachment_urls": urls_for_post,
+                "scheduled_at": post["scheduled_at"],
+                "author_id": interaction.user.id,
+                "thread_name": post["thread_name"],
+                "recurrence": post["recurrence"],
+            }
+            for post, urls_for_post in zip(parsed, attachment_urls)
+        ]
+        try:
+            inserted = await add_scheduled_posts_bulk(rows)
+        except Exception:
+            await posts.cleanup_r2_now(uploaded)
+            raise
+    finally:
+        R2_IN_FLIGHT.release(held)
+
+    for row in inserted:
+        posts.schedule_post(posts.SCHEDULED_POSTS_CACHE.add(posts.cacheable_post(row)))
+    metrics.incr("posts.imported", len(inserted))
+    return inserted, len(uploaded)
+
+
+def setup(bot):
+    @bot.tree.command(name="post_importar", description="(Staff) Agenda publicaciones en lote desde un CSV, JSON o zip")
+    @require_staff()
+    @app_commands.describe(
+        archivo="CSV/JSON con columnas canal, titulo, contenido, fecha, hilo, repetir, adjuntos (o un zip con posts.csv/posts.json y los adjuntos)"
+    )
+    async def post_importar(interaction: discord.Interaction, archivo: discord.Attachment):
+        if await db_unavailable(interaction):
+            return
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        try:
+            inserted, uploaded = await import_posts(interaction, archivo)
+        except PostImportError as e:
+            await interaction.followup.send(f"❌ {e}"[:2000], ephemeral=True)
+            return
+        except Exception as e:
+            print(f"❌ Error importando publicaciones: {e}")
+            await interaction.followup.send("❌ No se pudo completar la importación.", ephemeral=True)
+            return
+
+        first = min(row["scheduled_at"] for row in inserted)
+        last = max(row["scheduled_at"] for row in inserted)
+        await interaction.followup.send(
+            f"✅ {len(inserted)} publicación(es) agendada(s) con {uploaded} adjunto(s), "
+            f"del {posts.format_scheduled_at(first)} al {posts.format_scheduled_at(last)}.",
+            ephemeral=True
+        )
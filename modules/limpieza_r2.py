@@ -0,0 +1,161 @@
+from datetime import datetime, timedelta, timezone
+
+import discord
+from discord import app_commands
+from discord.ext import tasks
+
+from core import database
+from core.config import (
+    R2_GC_DRY_RUN,
+    R2_GC_GRACE_HOURS,
+    R2_GC_INTERVAL_HOURS,
+    db_unavailable,
+    require_staff,
+)
+from core.r2_storage import (
+    R2_CLEANUP_QUEUE,
+    R2_IN_FLIGHT,
+    list_r2_objects,
+    purge_r2_objects,
+    r2_key_from_url,
+)
+from modules import posts
+
+
+def format_bytes(size: int) -> str:
+    value = float(size)
+    for unit in ("B", "KB", "MB"):
+        if value < 1024:
+            return f"{value:.1f} {unit}"
+        value /= 1024
+    return f"{value:.1f} GB"
+
+
+async def referenced_r2_keys():
+    # r2_objects no cuenta como referencia: una subida que nunca se confirmó o una
+    # liberación fallida deja filas con conteo que ningún post usa.
+    urls = await database.get_scheduled_attachment_urls()
+    urls |= posts.pending_attachment_urls()
+    keys = {r2_key_from_url(url) for url in urls}
+    # Lo que ya está en la cola de borrado se resolverá por su cuenta, y lo que está
+    # en vuelo (subidas, importaciones) todavía no tiene fila que lo referencie.
+    return keys | R2_CLEANUP_QUEUE.pending_keys() | R2_IN_FLIGHT.keys()
+
+
+async def collect_r2_garbage(dry_run: bool = True):
+    if database.bot_pool is None:
+        raise RuntimeError("DB no disponible; no se puede decidir qué objetos son huérfanos.")
+
+    referenced = await referenced_r2_keys()
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=R2_GC_GRACE_HOURS)
+    tracked = await database.get_tracked_r2_keys()
+    leaked = {
+        row["key"]: row["ref_count"]
+        for row in await database.get_r2_objects_created_before(cutoff)
+        if row["key"] not in referenced
+    }
+    report = {
+        "scanned": 0,
+        "scanned_bytes": 0,
+        "orphans": 0,
+        "orphan_bytes": 0,
+        "leaked": len(leaked),
+        "reconciled": 0,
+        "deleted": 0,
+        "reclaimed_bytes": 0,
+        "dry_run": dry_run,
+    }
+    orphans = {}
+    async for item in list_r2_objects("adjuntos/"):
+        report["scanned"] += 1
+        report["scanned_bytes"] += item.get("Size", 0)
+        key = item["Key"]
+        if key in referenced or item["LastModified"] > cutoff:
+            continue
+        # Una fila reciente es una subida en curso o recién confirmada.
+        if key in tracked and key not in leaked:
+            continue
+        orphans[key] = item.get("Size", 0)
+
+    report["orphans"] = len(orphans)
+    report["orphan_bytes"] = sum(orphans.values())
+    if dry_run:
+        return report
+
+    claimed = set()
+    if leaked:
+        claimed = await database.claim_r2_objects_if_unchanged(list(leaked), list(leaked.values()))
+        for key in leaked.keys() - claimed:
+            orphans.pop(key, None)
+    untracked = [key for key in orphans if key not in claimed]
+    if untracked:
+        # Marca las keys en purging para que una subida idéntica no las reutilice
+        # durante el borrado; las que se registraron entretanto quedan fuera.
+        claimed_untracked = await database.claim_unreferenced_r2_objects(untracked)
+        for key in set(untracked) - claimed_untracked:
+            orphans.pop(key, None)
+        claimed |= claimed_untracked
+    if not claimed:
+        return report
+
+    failed = set(await purge_r2_objects(list(claimed)))
+    if failed:
+        await database.abort_r2_object_purge(list(failed))
+    deleted = [key for key in orphans if key not in failed]
+    report["reconciled"] = len((leaked.keys() & claimed) - failed)
+    report["deleted"] = len(deleted)
+    report["reclaimed_bytes"] = sum(orphans[key] for key in deleted)
+    return report
+
+
+def gc_report_text(report) -> str:
+    lines = [
+        f"Objetos revisados: **{report['scanned']}** ({format_bytes(report['scanned_bytes'])})",
+        f"Huérfanos (> {R2_GC_GRACE_HOURS}h): **{report['orphans']}** ({format_bytes(report['orphan_bytes'])})",
+        f"Referencias sin uso en la DB: **{report['leaked']}**",
+    ]
+    if report["dry_run"]:
+        lines.append("Modo simulación: no se borró nada.")
+    else:
+        lines.append(
+            f"Borrados: **{report['deleted']}** | Recuperado: **{format_bytes(report['reclaimed_bytes'])}** | "
+            f"Filas reconciliadas: **{report['reconciled']}**"
+        )
+    return "\n".join(lines)
+
+
+@tasks.loop(hours=R2_GC_INTERVAL_HOURS)
+async def r2_gc_task():
+    try:
+        report = await collect_r2_garbage(dry_run=R2_GC_DRY_RUN)
+    except Exception as e:
+        print(f"⚠️ No se pudo ejecutar la limpieza de huérfanos en R2: {e}")
+        return
+    print("🧹 Limpieza de R2: " + gc_report_text(report).replace("**", "").replace("\n", " | "))
+
+
+def setup(bot):
+    @r2_gc_task.before_loop
+    async def before_r2_gc():
+        await bot.wait_until_ready()
+
+    r2_gc_task.start()
+
+    @bot.tree.command(name="limpiar_r2", description="(Staff) Busca y borra adjuntos huérfanos en R2")
+    @require_staff()
+    @app_commands.describe(simulacion="Solo reportar, sin borrar (por defecto: sí)")
+    async def limpiar_r2(interaction: discord.Interaction, simulacion: bool = True):
+        if await db_unavailable(interaction):
+            return
+        await interaction.response.defer(ephemeral=True)
+        try:
+            report = await collect_r2_garbage(dry_run=simulacion)
+        except Exception as e:
+            await interaction.followup.send(f"❌ No se pudo completar la limpieza: {e}", ephemeral=True)
+            return
+        embed = discord.Embed(
+            title="Limpieza de adjuntos en R2",
+            description=gc_report_text(report),
+            color=discord.Color.orange() if simulacion else discord.Color.green(),
+        )
+        await interaction.followup.send(embed=embed, ephemeral=True)
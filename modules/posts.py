@@ -1,27 +1,85 @@
 import asyncio
+import bisect
 import io
+import json
+import time
+import weakref
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
 from urllib.parse import unquote, urlparse
 
-import aiohttp
 import discord
 from discord import app_commands, ui
 
-from core.config import TZ_BRASILIA, db_unavailable, require_staff
+from core import metrics
+from core.attachment_cache import ATTACHMENT_CACHE
+from core.config import (
+    ATTACHMENT_TRANSFER_CONCURRENCY,
+    POST_PREFETCH_LEAD_SECONDS,
+    POST_PREFETCH_MAX_BYTES,
+    POST_PREFETCH_MAX_POSTS,
+    POST_CLAIM_BATCH_SIZE,
+    POST_CLAIM_LEASE_SECONDS,
+    POST_CLAIM_SWEEP_SECONDS,
+    POST_LOAD_WINDOW_SECONDS,
+    POST_PUBLISH_CONCURRENCY,
+    R2_STREAM_READ_SIZE,
+    TZ_BRASILIA,
+    WORKER_ID,
+    db_unavailable,
+    require_staff,
+)
 from core.database import (
+    DB_LISTENER,
     add_scheduled_post,
+    claim_due_scheduled_posts,
+    delete_dead_letter_post,
     delete_scheduled_post,
+    extend_scheduled_post_claim,
+    get_dead_letter_posts,
+    get_scheduled_post_due_times,
+    get_scheduled_posts_by_ids,
     load_scheduled_posts,
+    record_publish_failure,
+    requeue_dead_letter_post,
+    reschedule_recurring_post,
+    set_scheduled_post_recurrence,
     update_scheduled_post,
 )
-from core.r2_storage import delete_from_r2, upload_to_r2
+from core.http_client import gather_limited, get_http_session
+from core.recurrence import describe_recurrence, next_occurrence, parse_recurrence
+from core.image_processing import optimize_image, should_process_image
+from core.r2_storage import (
+    R2_CLEANUP_QUEUE,
+    R2_IN_FLIGHT,
+    iter_bytes_chunks,
+    r2_key_from_url,
+    upload_deduplicated_to_r2,
+)
+from core.scheduler import DeadlineScheduler
 
 
-PENDING_POSTS = {}
-SCHEDULED_POSTS_CACHE = []
+POST_SCHEDULER = DeadlineScheduler()
+PREFETCH_SCHEDULER = DeadlineScheduler()
 MAX_PUBLISH_ATTEMPTS = 3
+PUBLISH_RETRY_DELAY_SECONDS = 60
+FINALIZE_MAX_ATTEMPTS = 5
+PUBLISH_RETRY_MAX_DELAY_SECONDS = 3600
+PUBLISH_SEMAPHORE = asyncio.Semaphore(POST_PUBLISH_CONCURRENCY)
+# Referencias débiles: el lock de un canal desaparece cuando ninguna publicación lo usa.
+CHANNEL_PUBLISH_LOCKS = weakref.WeakValueDictionary()
+PUBLISH_TASKS = set()
+ATTACHMENT_VIEWS = weakref.WeakSet()
+POST_STUB_COLUMNS = ("id", "guild_id", "channel_id", "title", "scheduled_at", "next_attempt_at", "recurrence")
+POST_CHANGES_CHANNEL = "scheduled_posts_changes"
+POST_CHANGES_DEBOUNCE_SECONDS = 0.2
+PENDING_POST_CHANGES = set()
+POST_CHANGES_TASK = None
 R2_CLEANUP_DELAY_SECONDS = 30
 PENDING_TIMEOUT_SECONDS = 300
+PENDING_MAX_SESSIONS = 1000
+# Objetos de Discord que una sesión retiene y que se sueltan al expirar.
+PENDING_SESSION_OBJECT_KEYS = ("panel_interaction", "panel_message", "source_message")
 SOURCE_MESSAGE_DELETE_DELAY_SECONDS = 2
 POST_REACTION_EMOJIS = (
     discord.PartialEmoji(name="E05emoji", id=1284825952903364702),
@@ -29,14 +87,233 @@ POST_REACTION_EMOJIS = (
     discord.PartialEmoji(name="20260319172839", id=1484288004213444738),
 )
 
+
+class ScheduledPostStore:
+    """Cache de agendamientos indexada por id y por guild (ordenada por fecha)."""
+
+    def __init__(self):
+        self._posts = {}
+        self._by_guild = {}
+
+    def __len__(self):
+        return len(self._posts)
+
+    def __iter__(self):
+        return iter(list(self._posts.values()))
+
+    def __contains__(self, post_id):
+        return post_id in self._posts
+
+    @staticmethod
+    def _sort_key(post):
+        return post["scheduled_at"], post["id"]
+
+    def replace(self, posts):
+        self._posts = {post["id"]: post for post in posts}
+        self._by_guild = {}
+        for post in self._posts.values():
+            self._by_guild.setdefault(post["guild_id"], []).append(post)
+        for rows in self._by_guild.values():
+            rows.sort(key=self._sort_key)
+
+    def get(self, post_id):
+        return self._posts.get(post_id)
+
+    def add(self, post):
+        self.remove(post["id"])
+        self._posts[post["id"]] = post
+        rows = self._by_guild.setdefault(post["guild_id"], [])
+        bisect.insort(rows, post, key=self._sort_key)
+        return post
+
+    def update(self, post_id, changes):
+        post = self.remove(post_id)
+        if post is None:
+            return None
+        post.update(changes)
+        return self.add(post)
+
+    def remove(self, post_id):
+        post = self._posts.pop(post_id, None)
+        if post is None:
+            return None
+        rows = self._by_guild.get(post["guild_id"], [])
+        index = bisect.bisect_left(rows, self._sort_key(post), key=self._sort_key)
+        if index < len(rows) and rows[index] is post:
+            del rows[index]
+        else:
+            rows.remove(post)
+        if not rows:
+            self._by_guild.pop(post["guild_id"], None)
+        return post
+
+    def guild_posts(self, guild_id, limit=None):
+        rows = self._by_guild.get(guild_id, [])
+        return rows[:limit] if limit is not None else list(rows)
+
+    def guild_count(self, guild_id):
+        return len(self._by_guild.get(guild_id, ()))
+
+
+SCHEDULED_POSTS_CACHE = ScheduledPostStore()
+
+
+class PrefetchBuffer:
+    """Payloads listos para publicar (canal resuelto y adjuntos en memoria), con límite de posts y bytes."""
+
+    def __init__(self, max_posts: int, max_bytes: int):
+        self.max_posts = max_posts
+        self.max_bytes = max_bytes
+        self._payloads = OrderedDict()
+        self._size = 0
+
+    def __len__(self):
+        return len(self._payloads)
+
+    def put(self, post_id, payload):
+        self.drop(post_id)
+        if payload["size"] > self.max_bytes or self.max_posts <= 0:
+            return False
+        self._payloads[post_id] = payload
+        self._size += payload["size"]
+        while len(self._payloads) > self.max_posts or self._size > self.max_bytes:
+            _, evicted = self._payloads.popitem(last=False)
+            self._size -= evicted["size"]
+            metrics.incr("posts.prefetch_evicted")
+        return post_id in self._payloads
+
+    def take(self, post_id):
+        payload = self._payloads.pop(post_id, None)
+        if payload is not None:
+            self._size -= payload["size"]
+        return payload
+
+    def drop(self, post_id):
+        self.take(post_id)
+
+
+PREFETCHED_POSTS = PrefetchBuffer(POST_PREFETCH_MAX_POSTS, POST_PREFETCH_MAX_BYTES)
+
+
+class PendingPostSessions:
+    """Sesiones del flujo de /post por usuario, con expiración proactiva.
+
+    Un DeadlineScheduler hace de heap de vencimientos: al expirar una sesión se avisa
+    en su panel, se sueltan sus objetos de Discord y sus adjuntos van en un solo lote
+    a la cola de borrado de R2, sin esperar a que el usuario vuelva a escribir.
+    """
+
+    def __init__(self, timeout_seconds: int, max_sessions: int):
+        self.timeout_seconds = timeout_seconds
+        self.max_sessions = max_sessions
+        self._sessions = {}
+        self._expiry = DeadlineScheduler()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, user_id):
+        return user_id in self._sessions
+
+    def __getitem__(self, user_id):
+        return self._sessions[user_id]
+
+    def get(self, user_id, default=None):
+        return self._sessions.get(user_id, default)
+
+    def values(self):
+        return list(self._sessions.values())
+
+    def set(self, user_id, data):
+        previous = self._sessions.pop(user_id, None)
+        if previous is not None and previous is not data:
+            self._release([previous], "posts.sessions_abandoned")
+        self._sessions[user_id] = data
+        self.touch(user_id)
+        metrics.incr("posts.sessions_started")
+        while len(self._sessions) > self.max_sessions:
+            oldest = min(self._sessions, key=lambda key: self._sessions[key]["expires_at"])
+            self._expiry.cancel(oldest)
+            self._release([self._sessions.pop(oldest)], "posts.sessions_abandoned")
+
+    def touch(self, user_id):
+        data = self._sessions.get(user_id)
+        if data is None:
+            return
+        data["expires_at"] = datetime.now(timezone.utc) + timedelta(seconds=self.timeout_seconds)
+        self._expiry.schedule(user_id, data["expires_at"])
+
+    def pop(self, user_id, *default):
+        self._expiry.cancel(user_id)
+        return self._sessions.pop(user_id, *default)
+
+    @staticmethod
+    def is_expired(data):
+        return datetime.now(timezone.utc) > data.get("expires_at", datetime.now(timezone.utc))
+
+    @staticmethod
+    def _release(sessions, counter: str):
+        R2_CLEANUP_QUEUE.enqueue([
+            url for data in sessions for url in data.get("attachments") or ()
+        ])
+        metrics.incr(counter, len(sessions))
+
+    async def expire(self, user_ids):
+        expired = []
+        for user_id in user_ids:
+            data = self._sessions.get(user_id)
+            if data is None:
+                continue
+            if not self.is_expired(data):
+                self._expiry.schedule(user_id, data["expires_at"])
+                continue
+            expired.append(self._sessions.pop(user_id))
+        if not expired:
+            return
+
+        self._release(expired, "posts.sessions_expired")
+        print(f"⌛ {len(expired)} sesión(es) de /post expirada(s); activas: {len(self)}.")
+        await asyncio.gather(*(
+            edit_pending_panel(data, content="⌛ El tiempo para completar la publicación expiró.", embed=None, view=None)
+            for data in expired
+        ), return_exceptions=True)
+        for data in expired:
+            for key in PENDING_SESSION_OBJECT_KEYS:
+                data.pop(key, None)
+
+    async def run(self):
+        await self._expiry.run(self.expire)
+
+
+PENDING_POSTS = PendingPostSessions(PENDING_TIMEOUT_SECONDS, PENDING_MAX_SESSIONS)
+
+
 async def load_cache(guild_id=None):
-    global SCHEDULED_POSTS_CACHE
-    SCHEDULED_POSTS_CACHE = await load_scheduled_posts(guild_id)
+    SCHEDULED_POSTS_CACHE.replace(await load_scheduled_posts(guild_id, POST_LOAD_WINDOW_SECONDS))
+    POST_SCHEDULER.clear()
+    PREFETCH_SCHEDULER.clear()
+    for post in SCHEDULED_POSTS_CACHE:
+        schedule_post(post)
+
+
+def schedule_post(post, deadline=None):
+    deadline = deadline or post.get("next_attempt_at") or post["scheduled_at"]
+    POST_SCHEDULER.schedule(post["id"], deadline)
+    PREFETCHED_POSTS.drop(post["id"])
+    PREFETCH_SCHEDULER.schedule(
+        post["id"],
+        deadline - timedelta(seconds=POST_PREFETCH_LEAD_SECONDS),
+    )
 
 
-def guild_posts(guild_id):
-    rows = [p for p in SCHEDULED_POSTS_CACHE if p["guild_id"] == guild_id]
-    return sorted(rows, key=lambda x: x["scheduled_at"])
+def unschedule_post(post_id):
+    POST_SCHEDULER.cancel(post_id)
+    PREFETCH_SCHEDULER.cancel(post_id)
+    PREFETCHED_POSTS.drop(post_id)
+
+
+def guild_posts(guild_id, limit=None):
+    return SCHEDULED_POSTS_CACHE.guild_posts(guild_id, limit)
 
 
 def format_scheduled_at(value, fmt="%d/%m/%Y a las %H:%M"):
@@ -64,14 +341,60 @@ def build_panel_embed(guild_id):
 
     lines = []
     for i, row in enumerate(rows, 1):
-        lines.append(f"{i}. {row['title']}")
+        marker = " 🔁" if row.get("recurrence") else ""
+        lines.append(f"{i}. {row['title']}{marker}")
     embed.description = "\n".join(lines)
     return embed
 
 
+def build_dead_letter_embed(rows):
+    embed = discord.Embed(
+        title="Publicaciones fallidas",
+        color=discord.Color.red()
+    )
+    if not rows:
+        embed.description = "*No hay publicaciones fallidas.*"
+        return embed
+
+    lines = []
+    for row in rows:
+        error = (row["last_error"] or "sin detalle")[:120]
+        lines.append(
+            f"**#{row['id']}** {row['title'] or 'Sin título'} — <#{row['channel_id']}>\n"
+            f"{row['publish_attempts']} intento(s), último el "
+            f"{format_scheduled_at(row['failed_at'], '%d/%m/%Y %H:%M')}: `{error}`"
+        )
+    embed.description = "\n".join(lines)[:4096]
+    return embed
+
+
+def build_metrics_embed():
+    snapshot = metrics.snapshot()
+    counters = snapshot["counters"]
+    embed = discord.Embed(title="Métricas de publicaciones", color=discord.Color.blurple())
+    embed.add_field(
+        name="Sesiones de /post",
+        value=(
+            f"Activas: **{len(PENDING_POSTS)}**\n"
+            f"Iniciadas: {counters.get('posts.sessions_started', 0)} | "
+            f"Expiradas: {counters.get('posts.sessions_expired', 0)} | "
+            f"Abandonadas: {counters.get('posts.sessions_abandoned', 0)}"
+        ),
+        inline=False,
+    )
+    lines = [
+        f"`{name}`: {value}" for name, value in sorted(counters.items())
+        if not name.startswith("posts.sessions_")
+    ]
+    embed.add_field(name="Contadores", value="\n".join(lines)[:1024] or "*Sin datos.*", inline=False)
+    lines = [f"`{name}`: {metrics.timing_summary(name)}" for name in sorted(snapshot["timings"])]
+    embed.add_field(name="Tiempos", value="\n".join(lines)[:1024] or "*Sin datos.*", inline=False)
+    return embed
+
+
 def scheduled_options(guild_id):
     options = []
-    for row in guild_posts(guild_id)[:25]:
+    for row in guild_posts(guild_id, limit=25):
         fecha = format_scheduled_at(row["scheduled_at"], "%d/%m/%Y %H:%M")
         options.append(
             discord.SelectOption(
@@ -84,26 +407,125 @@ def scheduled_options(guild_id):
 
 
 def find_cached_post(post_id: int):
-    for post in SCHEDULED_POSTS_CACHE:
-        if post["id"] == post_id:
-            return post
-    return None
+    return SCHEDULED_POSTS_CACHE.get(post_id)
+
+
+def is_post_stub(post) -> bool:
+    # Los stubs de load_scheduled_posts no traen contenido ni adjuntos.
+    return "content" not in post
+
+
+async def hydrate_posts(post_ids):
+    """Completa los stubs indicados desde la DB y descarta los que ya no existen."""
+    stub_ids = [
+        post_id for post_id in post_ids
+        if (post := find_cached_post(post_id)) is not None and is_post_stub(post)
+    ]
+    if not stub_ids:
+        return
+    rows = {row["id"]: row for row in await get_scheduled_posts_by_ids(stub_ids)}
+    for post_id in stub_ids:
+        row = rows.get(post_id)
+        if row is None:
+            unschedule_post(post_id)
+            SCHEDULED_POSTS_CACHE.remove(post_id)
+        else:
+            SCHEDULED_POSTS_CACHE.update(post_id, dict(row))
+    metrics.incr("posts.hydrated", len(rows))
+
+
+async def get_full_post(post_id: int):
+    post = find_cached_post(post_id)
+    if post is not None and is_post_stub(post):
+        await hydrate_posts([post_id])
+        post = find_cached_post(post_id)
+    return post
+
+
+def cacheable_post(row):
+    """Fila completa si vence dentro de la ventana; si no, un stub como los de load_scheduled_posts."""
+    post = dict(row)
+    horizon = datetime.now(timezone.utc) + timedelta(seconds=POST_LOAD_WINDOW_SECONDS)
+    if (post.get("next_attempt_at") or post["scheduled_at"]) <= horizon:
+        return post
+    return {column: post.get(column) for column in POST_STUB_COLUMNS}
+
+
+async def apply_post_changes(post_ids):
+    """Aplica al cache y a los schedulers el estado actual en la DB de los posts indicados."""
+    rows = {row["id"]: row for row in await get_scheduled_posts_by_ids(post_ids)}
+    for post_id in post_ids:
+        row = rows.get(post_id)
+        if row is None:
+            unschedule_post(post_id)
+            SCHEDULED_POSTS_CACHE.remove(post_id)
+            continue
+        post = cacheable_post(row)
+        current = find_cached_post(post_id)
+        if current is not None and all(current.get(key) == value for key, value in post.items()):
+            # Eco de un cambio que este proceso ya aplicó.
+            continue
+        schedule_post(SCHEDULED_POSTS_CACHE.add(post))
+    metrics.incr("posts.notify_applied", len(post_ids))
+
+
+async def flush_post_changes():
+    while PENDING_POST_CHANGES:
+        await asyncio.sleep(POST_CHANGES_DEBOUNCE_SECONDS)
+        post_ids = list(PENDING_POST_CHANGES)
+        PENDING_POST_CHANGES.clear()
+        try:
+            await apply_post_changes(post_ids)
+        except Exception as e:
+            print(f"⚠️ No se pudieron aplicar cambios de agendamientos: {e}")
+            PENDING_POST_CHANGES.update(post_ids)
+            await asyncio.sleep(PUBLISH_RETRY_DELAY_SECONDS)
+
+
+def schedule_post_changes_flush():
+    global POST_CHANGES_TASK
+    if POST_CHANGES_TASK is None or POST_CHANGES_TASK.done():
+        POST_CHANGES_TASK = asyncio.get_running_loop().create_task(flush_post_changes())
+
+
+def on_scheduled_posts_notify(payload: str):
+    # Los NOTIFY de una misma ráfaga se agrupan en una sola consulta.
+    PENDING_POST_CHANGES.add(int(json.loads(payload)["id"]))
+    schedule_post_changes_flush()
+
+
+async def hydrate_post_window():
+    horizon = datetime.now(timezone.utc) + timedelta(seconds=POST_LOAD_WINDOW_SECONDS)
+    due_stubs = [
+        post["id"] for post in SCHEDULED_POSTS_CACHE
+        if is_post_stub(post) and (post.get("next_attempt_at") or post["scheduled_at"]) <= horizon
+    ]
+    await hydrate_posts(due_stubs)
+
+
+async def refresh_post_window():
+    # Avanza la ventana: los stubs que se acercan a su fecha se cargan completos.
+    while True:
+        await asyncio.sleep(min(3600, POST_LOAD_WINDOW_SECONDS / 4))
+        from core import database
+        if database.bot_pool is None:
+            continue
+        try:
+            await hydrate_post_window()
+        except Exception as e:
+            print(f"⚠️ No se pudo hidratar la ventana de agendamientos: {e}")
 
 
 async def cleanup_r2_after_delay(urls):
     if not urls:
         return
-
-    await asyncio.sleep(R2_CLEANUP_DELAY_SECONDS)
-    for url in urls:
-        await delete_from_r2(url)
+    R2_CLEANUP_QUEUE.enqueue(urls, delay=R2_CLEANUP_DELAY_SECONDS)
 
 
 async def cleanup_r2_now(urls):
     if not urls:
         return
-    for url in urls:
-        await delete_from_r2(url)
+    R2_CLEANUP_QUEUE.enqueue(urls)
 
 
 async def delete_message_after_delay(message, delay_seconds=SOURCE_MESSAGE_DELETE_DELAY_SECONDS):
@@ -142,50 +564,165 @@ async def delete_previous_prompt(message, interaction):
             print(f"⚠️ No se pudo borrar la solicitud anterior del post: {e}")
 
 
+async def upload_attachment(session, attachment: discord.Attachment, guild_id=None):
+    try:
+        async with session.get(attachment.url) as resp:
+            if resp.status != 200:
+                print(f"⚠️ No se pudo descargar adjunto de Discord: {attachment.url}")
+                return None
+            if should_process_image(attachment.filename, attachment.size):
+                # Las imágenes grandes se re-codifican enteras; el resto se transmite por partes.
+                data, filename = await optimize_image(await resp.read(), attachment.filename, guild_id)
+                chunks = iter_bytes_chunks(data)
+            else:
+                filename = attachment.filename
+                chunks = resp.content.iter_chunked(R2_STREAM_READ_SIZE)
+            r2_url = await upload_deduplicated_to_r2(chunks, filename)
+            print(f"✅ Adjunto subido a R2: {r2_url}")
+            return r2_url
+    except Exception as e:
+        print(f"⚠️ Error subiendo adjunto a R2: {e}")
+        return None
+
+
 async def upload_message_attachments(message: discord.Message):
-    r2_urls = []
     if not message.attachments:
-        return r2_urls
+        return []
 
-    async with aiohttp.ClientSession() as session:
-        for attachment in message.attachments:
-            try:
-                async with session.get(attachment.url) as resp:
-                    if resp.status == 200:
-                        file_bytes = await resp.read()
-                        r2_url = await upload_to_r2(file_bytes, attachment.filename)
-                        r2_urls.append(r2_url)
-                        print(f"✅ Adjunto subido a R2: {r2_url}")
-                    else:
-                        print(f"⚠️ No se pudo descargar adjunto de Discord: {attachment.url}")
-            except Exception as e:
-                print(f"⚠️ Error subiendo adjunto a R2: {e}")
-    return r2_urls
+    session = await get_http_session()
+    guild_id = message.guild.id if message.guild else None
+    held = []
+
+    async def upload(attachment):
+        url = await upload_attachment(session, attachment, guild_id)
+        if url:
+            R2_IN_FLIGHT.hold([url])
+            held.append(url)
+        return url
+
+    try:
+        r2_urls = await gather_limited(message.attachments, upload, ATTACHMENT_TRANSFER_CONCURRENCY)
+    finally:
+        # Quien llama guarda las URLs en la sesión sin ceder el loop.
+        R2_IN_FLIGHT.release(held)
+    return [url for url in r2_urls if url]
+
+
+async def file_from_r2_url(session, url):
+    parsed = urlparse(url)
+    filename = unquote(parsed.path.split("/")[-1])
+    key = r2_key_from_url(url)
+    cached_path = await ATTACHMENT_CACHE.get_path_async(key)
+    if cached_path is not None:
+        try:
+            file = await asyncio.to_thread(discord.File, cached_path, filename=filename)
+            metrics.incr("attachments.cache_hit")
+            return file
+        except OSError:
+            await ATTACHMENT_CACHE.evict_async(key)
+
+    metrics.incr("attachments.cache_miss")
+    try:
+        async with session.get(url) as resp:
+            if resp.status != 200:
+                print(f"⚠️ No se pudo descargar adjunto: {url} | Status: {resp.status}")
+                return None
+            data = await resp.read()
+            await ATTACHMENT_CACHE.put_bytes_async(key, data)
+            return discord.File(io.BytesIO(data), filename=filename)
+    except Exception as e:
+        print(f"⚠️ Error descargando adjunto {url}: {e}")
+        return None
 
 
 async def files_from_r2_urls(urls):
-    files = []
     if not urls:
-        return files
+        return []
 
-    async with aiohttp.ClientSession() as session:
-        for url in urls:
-            try:
-                async with session.get(url) as resp:
-                    if resp.status == 200:
-                        data = await resp.read()
-                        parsed = urlparse(url)
-                        filename = unquote(parsed.path.split("/")[-1])
-                        files.append(discord.File(io.BytesIO(data), filename=filename))
-                    else:
-                        print(f"⚠️ No se pudo descargar adjunto: {url} | Status: {resp.status}")
-            except Exception as e:
-                print(f"⚠️ Error descargando adjunto {url}: {e}")
-    return files
+    session = await get_http_session()
+    files = await gather_limited(
+        urls,
+        lambda url: file_from_r2_url(session, url),
+        ATTACHMENT_TRANSFER_CONCURRENCY,
+    )
+    return [file for file in files if file is not None]
+
+
+async def attachment_bytes_from_r2_url(session, url):
+    parsed = urlparse(url)
+    filename = unquote(parsed.path.split("/")[-1])
+    key = r2_key_from_url(url)
+    data = await ATTACHMENT_CACHE.read_bytes_async(key)
+    if data is not None:
+        return filename, data
+
+    async with session.get(url) as resp:
+        if resp.status != 200:
+            raise RuntimeError(f"status {resp.status} descargando {url}")
+        data = await resp.read()
+    await ATTACHMENT_CACHE.put_bytes_async(key, data)
+    return filename, data
 
 
-async def send_post_to_channel(channel, content, attachment_urls):
-    files = await files_from_r2_urls(attachment_urls)
+async def prefetch_post(bot, post):
+    guild = bot.get_guild(post["guild_id"])
+    channel = guild.get_channel(post["channel_id"]) if guild else None
+    if channel is None:
+        return
+
+    attachment_urls = tuple(post.get("attachment_urls") or ())
+    session = await get_http_session()
+    try:
+        files = await gather_limited(
+            attachment_urls,
+            lambda url: attachment_bytes_from_r2_url(session, url),
+            ATTACHMENT_TRANSFER_CONCURRENCY,
+        )
+    except Exception as e:
+        print(f"⚠️ No se pudo precargar el post agendado {post['id']}: {e}")
+        return
+
+    current = find_cached_post(post["id"])
+    if current is None or tuple(current.get("attachment_urls") or ()) != attachment_urls:
+        return
+    PREFETCHED_POSTS.put(post["id"], {
+        "channel": channel,
+        "attachment_urls": attachment_urls,
+        "files": files,
+        "size": sum(len(data) for _, data in files),
+    })
+
+
+async def prefetch_due_posts(bot, post_ids):
+    try:
+        await hydrate_posts(post_ids)
+    except Exception as e:
+        print(f"⚠️ No se pudieron hidratar posts para precarga: {e}")
+        return
+    posts_to_prefetch = [
+        post for post in map(find_cached_post, post_ids)
+        if post is not None
+    ]
+    await asyncio.gather(*(prefetch_post(bot, post) for post in posts_to_prefetch))
+
+
+def take_prefetched_payload(post):
+    payload = PREFETCHED_POSTS.take(post["id"])
+    if payload is None or payload["attachment_urls"] != tuple(post.get("attachment_urls") or ()):
+        metrics.incr("posts.prefetch_miss")
+        return None
+    metrics.incr("posts.prefetch_hit")
+    return payload
+
+
+async def send_post_to_channel(channel, content, attachment_urls, prefetched=None):
+    if prefetched is not None:
+        files = [
+            discord.File(io.BytesIO(data), filename=filename)
+            for filename, data in prefetched["files"]
+        ]
+    else:
+        files = await files_from_r2_urls(attachment_urls)
     if files:
         return await channel.send(content=content or "", files=files)
     return await channel.send(content=content or "")
@@ -202,13 +739,74 @@ async def add_post_reactions(message: discord.Message, post_label):
             )
 
 
+async def create_post_thread(message: discord.Message, thread_name):
+    if not thread_name:
+        return None
+    try:
+        await message.create_thread(name=thread_name)
+    except Exception as error:
+        return error
+    return None
+
+
+async def decorate_post(message: discord.Message, post_label, thread_name=None):
+    """Reacciones e hilo a la vez; devuelve el error del hilo, si lo hubo.
+
+    Las reacciones comparten bucket de rate limit y discord.py las serializa igual,
+    así que se mantienen en orden entre sí; el hilo va por otra ruta y corre en paralelo.
+    """
+    _, thread_error = await asyncio.gather(
+        add_post_reactions(message, post_label),
+        create_post_thread(message, thread_name),
+    )
+    return thread_error
+
+
+async def decorate_scheduled_post(message: discord.Message, post_id, thread_name, scheduled_at):
+    thread_error = await decorate_post(message, post_id, thread_name)
+    if thread_error is not None:
+        print(f"⚠️ No se pudo crear hilo para post {post_id}: {thread_error}")
+    metrics.observe(
+        "posts.decorated_latency",
+        (datetime.now(timezone.utc) - scheduled_at).total_seconds(),
+    )
+
+
+def start_post_decoration(message: discord.Message, post):
+    # Corre en segundo plano para no retrasar el siguiente post del canal.
+    task = asyncio.get_running_loop().create_task(
+        decorate_scheduled_post(message, post["id"], post.get("thread_name"), post["scheduled_at"])
+    )
+    PUBLISH_TASKS.add(task)
+    task.add_done_callback(PUBLISH_TASKS.discard)
+
+
+def track_attachment_view(view):
+    # Las vistas de confirmación conservan los adjuntos después de cerrar la sesión.
+    ATTACHMENT_VIEWS.add(view)
+
+
+def pending_attachment_urls():
+    urls = set()
+    for data in PENDING_POSTS.values():
+        urls.update(data.get("attachments") or ())
+    for view in list(ATTACHMENT_VIEWS):
+        if not view.is_finished():
+            urls.update(view.data.get("attachments") or ())
+    return urls
+
+
 def pending_is_expired(data):
-    return datetime.now(timezone.utc) > data.get("expires_at", datetime.now(timezone.utc))
+    return PENDING_POSTS.is_expired(data)
 
 
 def set_pending(user_id, data):
-    data["expires_at"] = datetime.now(timezone.utc) + timedelta(seconds=PENDING_TIMEOUT_SECONDS)
-    PENDING_POSTS[user_id] = data
+    PENDING_POSTS.set(user_id, data)
+
+
+def pending_session_is_current(user_id, data) -> bool:
+    # Una subida larga puede cruzar el vencimiento: el barrido ya liberó la sesión.
+    return PENDING_POSTS.get(user_id) is data
 
 
 async def edit_pending_panel(data, *, content=None, embed=None, view=None):
@@ -282,7 +880,7 @@ class PostPanelView(AuthorView):
     async def edit_post(self, interaction: discord.Interaction, button: ui.Button):
         if not await self.guard(interaction):
             return
-        if not guild_posts(interaction.guild_id):
+        if not SCHEDULED_POSTS_CACHE.guild_count(interaction.guild_id):
             return await interaction.response.edit_message(
                 content=None,
                 embed=build_panel_embed(interaction.guild_id),
@@ -298,7 +896,7 @@ class PostPanelView(AuthorView):
     async def delete_post(self, interaction: discord.Interaction, button: ui.Button):
         if not await self.guard(interaction):
             return
-        if not guild_posts(interaction.guild_id):
+        if not SCHEDULED_POSTS_CACHE.guild_count(interaction.guild_id):
             return await interaction.response.edit_message(
                 content=None,
                 embed=build_panel_embed(interaction.guild_id),
@@ -417,7 +1015,7 @@ class ScheduledSelect(ui.Select):
         if not await view.guard(interaction):
             return
 
-        post = find_cached_post(int(self.values[0]))
+        post = await get_full_post(int(self.values[0]))
         if not post:
             return await interaction.response.edit_message(
                 content="❌ No se encontró el agendamiento seleccionado.",
@@ -521,6 +1119,7 @@ class ScheduleConfirmView(AuthorView):
     def __init__(self, author_id: int, data):
         super().__init__(author_id, timeout=60)
         self.data = data
+        track_attachment_view(self)
         self.processing = False
 
     async def begin_processing(self, interaction: discord.Interaction) -> bool:
@@ -575,7 +1174,7 @@ class ScheduleConfirmView(AuthorView):
             return
 
         if post_id:
-            SCHEDULED_POSTS_CACHE.append({
+            post = {
                 "id": post_id,
                 "guild_id": interaction.guild_id,
                 "channel_id": self.data["channel_id"],
@@ -585,7 +1184,9 @@ class ScheduleConfirmView(AuthorView):
                 "scheduled_at": self.data["scheduled_at"],
                 "author_id": interaction.user.id,
                 "thread_name": self.data.get("thread_name")
-            })
+            }
+            SCHEDULED_POSTS_CACHE.add(post)
+            schedule_post(post)
         else:
             await cleanup_r2_now(self.data.get("attachments"))
             await interaction.edit_original_response(
@@ -631,6 +1232,7 @@ class InstantConfirmView(AuthorView):
     def __init__(self, author_id: int, data):
         super().__init__(author_id, timeout=60)
         self.data = data
+        track_attachment_view(self)
         self.processing = False
 
     async def begin_processing(self, interaction: discord.Interaction) -> bool:
@@ -669,10 +1271,6 @@ class InstantConfirmView(AuthorView):
                 self.data["content"],
                 self.data["attachments"],
             )
-            await add_post_reactions(
-                sent_message,
-                f"inmediato de {interaction.user.id}",
-            )
         except Exception as e:
             await cleanup_r2_now(self.data.get("attachments"))
             PENDING_POSTS.pop(interaction.user.id, None)
@@ -684,17 +1282,17 @@ class InstantConfirmView(AuthorView):
             self.stop()
             return
 
-        thread_error = None
         thread_name = self.data.get("thread_name")
-        if thread_name:
-            try:
-                await sent_message.create_thread(name=thread_name)
-            except Exception as error:
-                thread_error = error
-                print(
-                    "⚠️ La publicación inmediata se envió, pero no se pudo "
-                    f"crear el hilo `{thread_name}`: {error}"
-                )
+        thread_error = await decorate_post(
+            sent_message,
+            f"inmediato de {interaction.user.id}",
+            thread_name,
+        )
+        if thread_error is not None:
+            print(
+                "⚠️ La publicación inmediata se envió, pero no se pudo "
+                f"crear el hilo `{thread_name}`: {thread_error}"
+            )
 
         interaction.client.loop.create_task(cleanup_r2_after_delay(self.data.get("attachments")))
         PENDING_POSTS.pop(interaction.user.id, None)
@@ -758,6 +1356,7 @@ class EditDateChoiceView(AuthorView):
     def __init__(self, author_id: int, data):
         super().__init__(author_id)
         self.data = data
+        track_attachment_view(self)
 
     @ui.button(label="Conservar", style=discord.ButtonStyle.success)
     async def keep(self, interaction: discord.Interaction, button: ui.Button):
@@ -827,6 +1426,7 @@ class EditConfirmView(AuthorView):
     def __init__(self, author_id: int, data):
         super().__init__(author_id, timeout=60)
         self.data = data
+        track_attachment_view(self)
 
     @ui.button(label="Confirmar", style=discord.ButtonStyle.success)
     async def confirm(self, interaction: discord.Interaction, button: ui.Button):
@@ -835,8 +1435,14 @@ class EditConfirmView(AuthorView):
         if await db_unavailable(interaction):
             return
 
-        post = find_cached_post(self.data["post_id"])
+        if PENDING_POSTS.pop(interaction.user.id, None) is not self.data:
+            # La sesión expiró y sus adjuntos ya se liberaron.
+            self.stop()
+            return await interaction.response.edit_message(content="⌛ El tiempo para completar la edición expiró.", embed=None, view=None)
+
+        post = await get_full_post(self.data["post_id"])
         if not post:
+            await cleanup_r2_now(self.data.get("attachments"))
             return await interaction.response.edit_message(content="❌ No se encontró el agendamiento.", embed=None, view=None)
 
         old_attachments = post.get("attachment_urls")
@@ -852,9 +1458,9 @@ class EditConfirmView(AuthorView):
             await cleanup_r2_now(self.data.get("attachments"))
             return await interaction.response.edit_message(content="❌ No se pudo actualizar el agendamiento.", embed=None, view=None)
 
-        post.update(dict(row))
+        post = SCHEDULED_POSTS_CACHE.update(post["id"], dict(row)) or post
+        schedule_post(post)
         interaction.client.loop.create_task(cleanup_r2_after_delay(old_attachments))
-        PENDING_POSTS.pop(interaction.user.id, None)
         await interaction.response.edit_message(content="✅ Agendamiento actualizado correctamente.", embed=None, view=None)
         self.stop()
 
@@ -862,8 +1468,8 @@ class EditConfirmView(AuthorView):
     async def cancel(self, interaction: discord.Interaction, button: ui.Button):
         if not await self.guard(interaction):
             return
-        await cleanup_r2_now(self.data.get("attachments"))
-        PENDING_POSTS.pop(interaction.user.id, None)
+        if PENDING_POSTS.pop(interaction.user.id, None) is self.data:
+            await cleanup_r2_now(self.data.get("attachments"))
         await interaction.response.edit_message(content="❌ Edición cancelada.", embed=None, view=None)
         self.stop()
 
@@ -878,14 +1484,16 @@ class DeleteConfirmView(AuthorView):
         if not await self.guard(interaction):
             return
 
-        post = find_cached_post(self.post_id)
+        post = await get_full_post(self.post_id)
         if not post:
             return await interaction.response.edit_message(content="❌ No se encontró el agendamiento.", embed=None, view=None)
 
-        await delete_scheduled_post(post["id"])
-        if post in SCHEDULED_POSTS_CACHE:
-            SCHEDULED_POSTS_CACHE.remove(post)
-        await cleanup_r2_now(post.get("attachment_urls"))
+        deleted = await delete_scheduled_post(post["id"])
+        unschedule_post(post["id"])
+        SCHEDULED_POSTS_CACHE.remove(post["id"])
+        # Si el post se publicó entretanto, quien borró la fila ya liberó sus adjuntos.
+        if deleted:
+            await cleanup_r2_now(post.get("attachment_urls"))
         await interaction.response.edit_message(content="🗑️ Agendamiento eliminado completamente.", embed=None, view=None)
         self.stop()
 
@@ -923,6 +1531,10 @@ async def handle_message(message: discord.Message) -> bool:
         data["content"] = message.content
         data["source_message"] = message
         data["attachments"] = await upload_message_attachments(message)
+        if not pending_session_is_current(message.author.id, data):
+            await cleanup_r2_now(data["attachments"])
+            return True
+        PENDING_POSTS.touch(message.author.id)
 
         if data["mode"] == "instant":
             data["title"] = post_title_from_content(message.content)
@@ -982,6 +1594,10 @@ async def handle_message(message: discord.Message) -> bool:
 
         data["content"] = message.content
         data["attachments"] = await upload_message_attachments(message)
+        if not pending_session_is_current(message.author.id, data):
+            await cleanup_r2_now(data["attachments"])
+            return True
+        PENDING_POSTS.touch(message.author.id)
         data["title"] = post["title"]
         data["channel_id"] = post["channel_id"]
 
@@ -1001,71 +1617,294 @@ async def handle_message(message: discord.Message) -> bool:
     return False
 
 
-async def publish_due_posts(bot):
+async def publish_due_posts(bot, post_ids):
     now = datetime.now(TZ_BRASILIA)
     if not (0 <= now.hour < 24):
         return
 
     from core import database
     if database.bot_pool is None:
+        retry_at = datetime.now(timezone.utc) + timedelta(seconds=PUBLISH_RETRY_DELAY_SECONDS)
+        for post_id in post_ids:
+            POST_SCHEDULER.schedule(post_id, retry_at)
         return
 
-    now_utc = datetime.now(timezone.utc)
-    posts_to_publish = [
-        p for p in SCHEDULED_POSTS_CACHE
-        if p["scheduled_at"] <= now_utc
-    ]
+    posts_to_publish = await claim_due_posts(post_ids)
+    if not posts_to_publish:
+        return
 
+    # Un worker por canal mantiene el orden por scheduled_at dentro del canal;
+    # el semáforo limita cuántos posts se publican a la vez en total.
+    by_channel = {}
     for post in posts_to_publish:
-        published = False
-        guild = bot.get_guild(post["guild_id"])
-        if guild:
-            channel = guild.get_channel(post["channel_id"])
-            if channel:
-                try:
-                    sent_message = await send_post_to_channel(channel, post["content"] or "", post.get("attachment_urls"))
-                    published = True
+        by_channel.setdefault(post["channel_id"], []).append(post)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(
+        publish_channel_posts(bot, channel_id, channel_posts)
+        for channel_id, channel_posts in by_channel.items()
+    ))
+    elapsed = time.perf_counter() - started
+    published = sum(results)
+    metrics.incr("posts.published", published)
+    metrics.incr("posts.failed", len(posts_to_publish) - published)
+    metrics.observe("posts.batch_duration", elapsed)
+    print(
+        f"📤 Lote de agendamientos: {published}/{len(posts_to_publish)} publicado(s) "
+        f"en {elapsed:.2f}s ({published / max(elapsed, 0.001):.2f} posts/s). "
+        f"Latencia: {metrics.timing_summary('posts.publish_latency')}. "
+        f"Hasta decorado: {metrics.timing_summary('posts.decorated_latency')}. "
+        f"Precarga: {metrics.COUNTERS.get('posts.prefetch_hit', 0)} acierto(s), "
+        f"{metrics.COUNTERS.get('posts.prefetch_miss', 0)} fallo(s)."
+    )
 
-                    await add_post_reactions(sent_message, post["id"])
 
-                    thread_name = post.get("thread_name")
-                    if thread_name:
-                        try:
-                            await sent_message.create_thread(name=thread_name)
-                        except Exception as e:
-                            print(f"⚠️ No se pudo crear hilo para post {post['id']}: {e}")
+async def claim_due_posts(post_ids=()):
+    """Reclama en la DB los posts vencidos y sincroniza la cache local con las filas obtenidas.
 
+    Con varios workers un post solo lo publica quien lo reclama; los ids que este
+    worker esperaba pero no obtuvo se reagendan para cuando venza la lease ajena.
+    """
+    try:
+        rows = await claim_due_scheduled_posts(WORKER_ID, POST_CLAIM_LEASE_SECONDS, POST_CLAIM_BATCH_SIZE)
+    except Exception as e:
+        print(f"⚠️ No se pudieron reclamar posts agendados: {e}")
+        retry_at = datetime.now(timezone.utc) + timedelta(seconds=PUBLISH_RETRY_DELAY_SECONDS)
+        for post_id in post_ids:
+            POST_SCHEDULER.schedule(post_id, retry_at)
+        return []
+
+    claimed = []
+    for row in rows:
+        POST_SCHEDULER.cancel(row["id"])
+        post = SCHEDULED_POSTS_CACHE.update(row["id"], dict(row)) or SCHEDULED_POSTS_CACHE.add(dict(row))
+        claimed.append(post)
+
+    claimed_ids = {post["id"] for post in claimed}
+    missed = [post_id for post_id in post_ids if post_id not in claimed_ids]
+    if missed:
+        try:
+            due_times = await get_scheduled_post_due_times(missed)
+        except Exception as e:
+            print(f"⚠️ No se pudo consultar el estado de {len(missed)} post(s) agendado(s): {e}")
+            retry_at = datetime.now(timezone.utc) + timedelta(seconds=PUBLISH_RETRY_DELAY_SECONDS)
+            due_times = {post_id: retry_at for post_id in missed}
+        for post_id in missed:
+            post = find_cached_post(post_id)
+            if post_id not in due_times:
+                # Otro worker ya lo publicó o lo borró.
+                unschedule_post(post_id)
+                SCHEDULED_POSTS_CACHE.remove(post_id)
+            elif post is not None:
+                schedule_post(post, due_times[post_id])
+
+    metrics.incr("posts.claimed", len(claimed))
+    return sorted(claimed, key=lambda post: (post["scheduled_at"], post["id"]))
+
+
+async def sweep_due_posts(bot):
+    # Recoge posts agendados por otros workers o cuya lease venció tras una caída.
+    while True:
+        await asyncio.sleep(POST_CLAIM_SWEEP_SECONDS)
+        from core import database
+        if database.bot_pool is not None:
+            await dispatch_due_posts(bot, [])
+
+
+async def renew_post_claim(post) -> bool:
+    """Extiende la lease justo antes de enviar; un post puede esperar en cola más que la lease original."""
+    try:
+        renewed = await extend_scheduled_post_claim(post["id"], WORKER_ID, POST_CLAIM_LEASE_SECONDS)
+    except Exception as e:
+        # Sin poder confirmar la lease no se envía: al vencer, el sweep lo vuelve a reclamar.
+        print(f"⚠️ No se pudo renovar la lease del post agendado {post['id']}: {e}")
+        return False
+    if not renewed:
+        metrics.incr("posts.claim_lost")
+        print(f"⚠️ El post agendado {post['id']} ya no está reclamado por este worker; no se envía.")
+    return renewed
+
+
+async def publish_channel_posts(bot, channel_id, channel_posts):
+    lock = CHANNEL_PUBLISH_LOCKS.setdefault(channel_id, asyncio.Lock())
+    published = 0
+    async with lock:
+        for post in channel_posts:
+            async with PUBLISH_SEMAPHORE:
+                if not await renew_post_claim(post):
+                    continue
+                try:
+                    if await publish_scheduled_post(bot, post):
+                        published += 1
                 except Exception as e:
-                    print(f"❌ Error al publicar post agendado {post['id']}: {e}")
-        else:
-            print(f"⚠️ No se encontró guild para post agendado {post['id']}: {post['guild_id']}")
+                    # Un fallo de un post no debe sacar al resto del canal del scheduler.
+                    print(f"❌ Error inesperado publicando post agendado {post['id']}: {e}")
+                    await handle_publish_failure(post, str(e) or type(e).__name__)
+    return published
+
+
+async def publish_scheduled_post(bot, post):
+    published = False
+    error = None
+    prefetched = take_prefetched_payload(post)
+    if prefetched is not None:
+        channel = prefetched["channel"]
+        guild = channel.guild
+    else:
+        guild = bot.get_guild(post["guild_id"])
+        channel = guild.get_channel(post["channel_id"]) if guild else None
+    if guild:
+        if channel:
+            try:
+                sent_message = await send_post_to_channel(
+                    channel,
+                    post["content"] or "",
+                    post.get("attachment_urls"),
+                    prefetched,
+                )
+                published = True
+                metrics.observe(
+                    "posts.publish_latency",
+                    (datetime.now(timezone.utc) - post["scheduled_at"]).total_seconds(),
+                )
 
-        if guild and not published and not guild.get_channel(post["channel_id"]):
-            print(f"⚠️ No se encontró canal para post agendado {post['id']}: {post['channel_id']}")
+                start_post_decoration(sent_message, post)
 
-        if published:
-            bot.loop.create_task(cleanup_r2_after_delay(post.get("attachment_urls")))
-            await delete_scheduled_post(post["id"])
-            if post in SCHEDULED_POSTS_CACHE:
-                SCHEDULED_POSTS_CACHE.remove(post)
-            continue
+            except Exception as e:
+                error = str(e)
+                print(f"❌ Error al publicar post agendado {post['id']}: {e}")
+    else:
+        error = f"guild {post['guild_id']} no encontrado"
+        print(f"⚠️ No se encontró guild para post agendado {post['id']}: {post['guild_id']}")
+
+    if guild and not published and not guild.get_channel(post["channel_id"]):
+        error = f"canal {post['channel_id']} no encontrado"
+        print(f"⚠️ No se encontró canal para post agendado {post['id']}: {post['channel_id']}")
+
+    if published:
+        try:
+            await finalize_published_post(post)
+        except Exception as e:
+            # El mensaje ya salió: se reintenta solo el cierre, nunca el envío.
+            print(f"⚠️ No se pudo cerrar el post agendado {post['id']} tras publicarlo: {e}")
+            task = bot.loop.create_task(retry_finalize_published_post(post))
+            PUBLISH_TASKS.add(task)
+            task.add_done_callback(PUBLISH_TASKS.discard)
+        return True
+
+    await handle_publish_failure(post, error or "error desconocido")
+    return False
 
-        post["publish_attempts"] = post.get("publish_attempts", 0) + 1
-        if post["publish_attempts"] < MAX_PUBLISH_ATTEMPTS:
+
+async def finalize_published_post(post):
+    if post.get("recurrence") and await reschedule_recurring(post):
+        return
+    deleted = await delete_scheduled_post(post["id"])
+    SCHEDULED_POSTS_CACHE.remove(post["id"])
+    # Solo quien borró la fila libera los adjuntos: un reintento o un borrado
+    # manual concurrente no vuelven a restar referencias.
+    if deleted:
+        await cleanup_r2_after_delay(post.get("attachment_urls"))
+
+
+async def retry_finalize_published_post(post):
+    for attempt in range(FINALIZE_MAX_ATTEMPTS):
+        # La lease se renueva antes de cada espera para que ningún worker lo reenvíe.
+        await renew_post_claim(post)
+        await asyncio.sleep(min(POST_CLAIM_LEASE_SECONDS / 2, PUBLISH_RETRY_DELAY_SECONDS * 2 ** attempt))
+        try:
+            await finalize_published_post(post)
+            return
+        except Exception as e:
             print(
-                f"⏳ Reintentando post agendado {post['id']} en el próximo ciclo "
-                f"({post['publish_attempts']}/{MAX_PUBLISH_ATTEMPTS})."
+                f"⚠️ Reintento {attempt + 1}/{FINALIZE_MAX_ATTEMPTS} de cierre del post "
+                f"agendado {post['id']} falló: {e}"
             )
-            continue
+    print(
+        f"❌ El post agendado {post['id']} se publicó pero no se pudo cerrar en la DB; "
+        "puede volver a enviarse cuando venza su lease."
+    )
 
-        print(f"🗑️ Post agendado {post['id']} falló {MAX_PUBLISH_ATTEMPTS} veces. Se eliminará.")
-        bot.loop.create_task(cleanup_r2_after_delay(post.get("attachment_urls")))
-        await delete_scheduled_post(post["id"])
-        if post in SCHEDULED_POSTS_CACHE:
-            SCHEDULED_POSTS_CACHE.remove(post)
+
+async def reschedule_recurring(post):
+    """Agenda la siguiente ocurrencia reutilizando la misma fila y los adjuntos ya subidos a R2."""
+    try:
+        next_at = next_occurrence(post["recurrence"], post["scheduled_at"], datetime.now(timezone.utc))
+    except ValueError as e:
+        print(f"⚠️ Recurrencia inválida en post agendado {post['id']} ({post['recurrence']}): {e}")
+        return False
+
+    row = await reschedule_recurring_post(post["id"], next_at)
+    if row is None:
+        SCHEDULED_POSTS_CACHE.remove(post["id"])
+        return True
+    schedule_post(SCHEDULED_POSTS_CACHE.add(cacheable_post(row)))
+    print(f"🔁 Post agendado {post['id']} reprogramado para el {format_scheduled_at(next_at)}.")
+    return True
+
+
+async def handle_publish_failure(post, error: str):
+    try:
+        row, dead_lettered = await record_publish_failure(
+            post["id"],
+            error,
+            PUBLISH_RETRY_DELAY_SECONDS,
+            PUBLISH_RETRY_MAX_DELAY_SECONDS,
+            MAX_PUBLISH_ATTEMPTS,
+        )
+    except Exception as e:
+        # Sin DB no se puede persistir el intento: se reintenta sin contarlo.
+        print(f"⚠️ No se pudo registrar el fallo del post agendado {post['id']}: {e}")
+        schedule_post(
+            post,
+            datetime.now(timezone.utc) + timedelta(seconds=PUBLISH_RETRY_DELAY_SECONDS),
+        )
+        return
+
+    if row is None:
+        SCHEDULED_POSTS_CACHE.remove(post["id"])
+        return
+
+    if dead_lettered:
+        metrics.incr("posts.dead_lettered")
+        print(
+            f"🪦 Post agendado {post['id']} falló {row['publish_attempts']} veces. "
+            "Movido a fallidos (/post_fallidos)."
+        )
+        SCHEDULED_POSTS_CACHE.remove(post["id"])
+        return
+
+    post = SCHEDULED_POSTS_CACHE.update(post["id"], dict(row)) or dict(row)
+    print(
+        f"⏳ Reintentando post agendado {post['id']} el "
+        f"{format_scheduled_at(row['next_attempt_at'], '%d/%m %H:%M:%S')} "
+        f"({row['publish_attempts']}/{MAX_PUBLISH_ATTEMPTS})."
+    )
+    schedule_post(post)
+
+
+async def dispatch_due_posts(bot, post_ids):
+    # El lote corre en segundo plano para que el scheduler siga atendiendo
+    # los siguientes vencimientos mientras se publica.
+    task = bot.loop.create_task(publish_due_posts(bot, post_ids))
+    PUBLISH_TASKS.add(task)
+    task.add_done_callback(PUBLISH_TASKS.discard)
+
+
+async def run_post_scheduler(bot):
+    await bot.wait_until_ready()
+    await asyncio.gather(
+        POST_SCHEDULER.run(lambda post_ids: dispatch_due_posts(bot, post_ids)),
+        PREFETCH_SCHEDULER.run(lambda post_ids: prefetch_due_posts(bot, post_ids)),
+        sweep_due_posts(bot),
+        refresh_post_window(),
+        PENDING_POSTS.run(),
+    )
 
 
 def setup(bot):
+    DB_LISTENER.subscribe(POST_CHANGES_CHANNEL, on_scheduled_posts_notify, on_reconnect=load_cache)
+
     @bot.tree.command(name="post", description="(Staff) Panel de publicaciones")
     @require_staff()
     async def post(interaction: discord.Interaction):
@@ -1076,3 +1915,87 @@ def setup(bot):
             view=PostPanelView(interaction.user.id, interaction.guild_id),
             ephemeral=True
         )
+
+    async def scheduled_post_autocomplete(interaction: discord.Interaction, current: str):
+        current = current.lower()
+        return [
+            app_commands.Choice(
+                name=f"{row['title']} ({format_scheduled_at(row['scheduled_at'], '%d/%m %H:%M')})"[:100],
+                value=row["id"],
+            )
+            for row in guild_posts(interaction.guild_id)
+            if current in str(row["title"]).lower()
+        ][:25]
+
+    @bot.tree.command(name="post_repetir", description="(Staff) Configura la repetición de una publicación agendada")
+    @require_staff()
+    @app_commands.describe(
+        post_id="Publicación agendada",
+        regla="diario | semanal:lun,mie,vie | cron:0 9 * * 1 | no",
+    )
+    @app_commands.autocomplete(post_id=scheduled_post_autocomplete)
+    async def post_repetir(interaction: discord.Interaction, post_id: int, regla: str):
+        if await db_unavailable(interaction):
+            return
+        try:
+            recurrence = parse_recurrence(regla)
+        except ValueError as e:
+            await interaction.response.send_message(f"❌ {e}", ephemeral=True)
+            return
+        row = await set_scheduled_post_recurrence(interaction.guild_id, post_id, recurrence)
+        if row is None:
+            await interaction.response.send_message("❌ No se encontró el agendamiento.", ephemeral=True)
+            return
+        SCHEDULED_POSTS_CACHE.add(cacheable_post(row))
+        await interaction.response.send_message(
+            f"✅ **{row['title']}**: {describe_recurrence(recurrence)}. "
+            f"Próxima publicación: {format_scheduled_at(row['scheduled_at'])}.",
+            ephemeral=True
+        )
+
+    @bot.tree.command(name="post_fallidos", description="(Staff) Lista las publicaciones que agotaron sus reintentos")
+    @require_staff()
+    async def post_fallidos(interaction: discord.Interaction):
+        if await db_unavailable(interaction):
+            return
+        rows = await get_dead_letter_posts(interaction.guild_id)
+        await interaction.response.send_message(embed=build_dead_letter_embed(rows), ephemeral=True)
+
+    @bot.tree.command(name="post_metricas", description="(Staff) Muestra las métricas de sesiones y publicaciones")
+    @require_staff()
+    async def post_metricas(interaction: discord.Interaction):
+        await interaction.response.send_message(embed=build_metrics_embed(), ephemeral=True)
+
+    @bot.tree.command(name="post_reintentar", description="(Staff) Vuelve a agendar una publicación fallida")
+    @require_staff()
+    @app_commands.describe(
+        post_id="ID de la publicación fallida (ver /post_fallidos)",
+        minutos="Minutos a esperar antes de publicarla (por defecto: ahora)",
+    )
+    async def post_reintentar(interaction: discord.Interaction, post_id: int, minutos: app_commands.Range[int, 0, 10080] = 0):
+        if await db_unavailable(interaction):
+            return
+        scheduled_at = datetime.now(timezone.utc) + timedelta(minutes=minutos)
+        row = await requeue_dead_letter_post(interaction.guild_id, post_id, scheduled_at)
+        if row is None:
+            await interaction.response.send_message(f"❌ No existe la publicación fallida #{post_id}.", ephemeral=True)
+            return
+        post = SCHEDULED_POSTS_CACHE.add(dict(row))
+        schedule_post(post)
+        await interaction.response.send_message(
+            f"✅ Publicación #{post_id} agendada de nuevo para el {format_scheduled_at(post['scheduled_at'])}.",
+            ephemeral=True
+        )
+
+    @bot.tree.command(name="post_descartar", description="(Staff) Elimina definitivamente una publicación fallida")
+    @require_staff()
+    @app_commands.describe(post_id="ID de la publicación fallida (ver /post_fallidos)")
+    async def post_descartar(interaction: discord.Interaction, post_id: int):
+        if await db_unavailable(interaction):
+            return
+        row = await delete_dead_letter_post(interaction.guild_id, post_id)
+        if row is None:
+            await interaction.response.send_message(f"❌ No existe la publicación fallida #{post_id}.", ephemeral=True)
+            return
+        await cleanup_r2_now(row["attachment_urls"])
+        await interaction.response.send_message(f"🗑️ Publicación fallida #{post_id} descartada.", ephemeral=True)
@@ -1,6 +1,8 @@
 import asyncio
+import json
 import logging
 import re
+import time
 
 import discord
 from discord import app_commands
@@ -9,6 +11,7 @@ from core import database
 from core.config import (
     EVENT_ADMIN_ROLE_ID,
     EVENT_ALLOWED_CHANNEL_IDS,
+    EVENT_CACHE_TTL_SECONDS,
     EVENT_CATALOG_MAX_ITEMS,
     EVENT_PANEL_ROLE_NAME,
     EVENT_PARTICIPANT_LIMITS,
@@ -27,6 +30,8 @@ DISCORD_ID_PATTERN = re.compile(r"^\d{17,20}$")
 USERS_PER_PAGE = 10
 PARTICIPANTS_PER_EMBED = 15
 EDIT_USERS_PER_PAGE = 20
+EVENT_CHANGES_CHANNEL = "event_instances_changes"
+BLACKLIST_CHANGES_CHANNEL = "event_blacklist_changes"
 BLACKLIST_MAX_ITEMS = 12
 STAFF_PANEL_THUMBNAIL_URL = (
     "https://pub-a09b3609b6b34dfab5c7aa7742cd1a8a.r2.dev/"
@@ -895,22 +900,188 @@ class EventUsersPaginator(AdminOwnerView):
         await self.manager.change_database_page(interaction, self.owner_id, self.page + 1)
 
 
+class BlacklistIndex:
+    """Blacklist de un guild en memoria, indexada por Discord ID y por ID Espacial."""
+
+    def __init__(self, rows=()):
+        self.by_user_id = {}
+        self.by_external_id = {}
+        for row in rows:
+            self.add(row)
+
+    def add(self, row):
+        if row["user_id"] is not None:
+            self.by_user_id[row["user_id"]] = row
+        self.by_external_id[row["external_id"]] = row
+
+    def remove(self, row):
+        entry = self.by_user_id.get(row["user_id"])
+        if entry is not None and entry["external_id"] == row["external_id"]:
+            del self.by_user_id[row["user_id"]]
+        self.by_external_id.pop(row["external_id"], None)
+
+    def match(self, external_id: str | None, user_id: int):
+        # Misma preferencia que get_event_blacklist_match: primero por Discord ID.
+        return self.by_user_id.get(user_id) or self.by_external_id.get(external_id)
+
+
 class RegistroEventos:
     def __init__(self, bot):
         self.bot = bot
         self.registration_locks: dict[tuple[int, int], asyncio.Lock] = {}
         self.finishing_guilds: set[int] = set()
         self.background_tasks: set[asyncio.Task] = set()
+        # guild_id -> (caduca_en, evento activo o None).
+        self.active_events: dict[int, tuple[float, object]] = {}
+        self.active_events_version = 0
+        self.blacklists: dict[int, BlacklistIndex] = {}
+        self.blacklists_version = 0
+        # Tras la carga completa, un guild ausente tiene la blacklist vacía
+        # salvo que esté en stale_blacklists.
+        self.blacklists_complete = False
+        self.stale_blacklists: set[int] = set()
 
     def database_ready(self) -> bool:
         return database.bot_pool is not None
 
+    async def get_active_event(self, guild_id: int):
+        """Evento activo del guild; solo consulta la DB si la cache caducó o fue invalidada.
+
+        El participant_count del registro cacheado no se mantiene al día.
+        """
+        cached = self.active_events.get(guild_id)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+        version = self.active_events_version
+        event = await database.get_active_event(guild_id)
+        # Si algo cambió durante la consulta, el resultado puede ser anterior al cambio.
+        if version == self.active_events_version:
+            self.active_events[guild_id] = (time.monotonic() + EVENT_CACHE_TTL_SECONDS, event)
+        return event
+
+    def cache_active_event(self, guild_id: int, event):
+        self.active_events_version += 1
+        self.active_events[guild_id] = (time.monotonic() + EVENT_CACHE_TTL_SECONDS, event)
+
+    def invalidate_active_event(self, guild_id: int | None = None):
+        self.active_events_version += 1
+        if guild_id is None:
+            self.active_events.clear()
+        else:
+            self.active_events.pop(guild_id, None)
+
+    async def resync_active_events(self):
+        self.invalidate_active_event()
+
+    def on_event_instances_notify(self, payload: str):
+        try:
+            change = json.loads(payload)
+            guild_id = int(change["guild_id"])
+        except (ValueError, KeyError, TypeError):
+            logger.warning("NOTIFY de eventos inválido: %s", payload)
+            return
+        cached = self.active_events.get(guild_id)
+        if cached is not None and self.notify_matches_cache(cached[1], change):
+            return
+        self.invalidate_active_event(guild_id)
+
+    @staticmethod
+    def notify_matches_cache(event, change) -> bool:
+        # Eco de una escritura de este proceso que ya se aplicó a la cache.
+        if change.get("op") == "DELETE":
+            return event is None
+        return (
+            event is not None
+            and event["id"] == change.get("id")
+            and event["status"] == change.get("status")
+            and event["registration_message_id"] == change.get("registration_message_id")
+        )
+
     async def require_database(self, interaction: discord.Interaction) -> bool:
         if self.database_ready():
             return True
         await send_ephemeral(interaction, "La base de datos no esta disponible.")
         return False
 
+    async def load_blacklists(self):
+        version = self.blacklists_version
+        try:
+            rows = await database.get_all_event_blacklists()
+        except Exception:
+            logger.exception("No se pudo precargar la blacklist de eventos")
+            return
+        if version != self.blacklists_version:
+            return
+        by_guild: dict[int, list] = {}
+        for row in rows:
+            by_guild.setdefault(row["guild_id"], []).append(row)
+        self.blacklists = {
+            guild_id: BlacklistIndex(guild_rows) for guild_id, guild_rows in by_guild.items()
+        }
+        self.stale_blacklists.clear()
+        self.blacklists_complete = True
+
+    async def get_blacklist_index(self, guild_id: int) -> BlacklistIndex:
+        index = self.blacklists.get(guild_id)
+        if index is not None:
+            return index
+        if self.blacklists_complete and guild_id not in self.stale_blacklists:
+            return self.blacklists.setdefault(guild_id, BlacklistIndex())
+        version = self.blacklists_version
+        index = BlacklistIndex(await database.get_event_blacklist(guild_id))
+        if version == self.blacklists_version:
+            self.blacklists[guild_id] = index
+            self.stale_blacklists.discard(guild_id)
+        return index
+
+    async def get_blacklist_match(self, guild_id: int, external_id: str | None, user_id: int):
+        index = await self.get_blacklist_index(guild_id)
+        return index.match(external_id, user_id)
+
+    def invalidate_blacklist(self, guild_id: int | None = None):
+        self.blacklists_version += 1
+        if guild_id is None:
+            self.blacklists.clear()
+            self.stale_blacklists.clear()
+            self.blacklists_complete = False
+        else:
+            self.blacklists.pop(guild_id, None)
+            self.stale_blacklists.add(guild_id)
+
+    def update_blacklist(self, guild_id: int, *, added=None, removed=None):
+        index = self.blacklists.get(guild_id)
+        if index is None:
+            # Sin índice cargado, la próxima consulta lo lee de la DB.
+            self.invalidate_blacklist(guild_id)
+            return
+        self.blacklists_version += 1
+        if added is not None:
+            index.add(added)
+        if removed is not None:
+            index.remove(removed)
+
+    async def resync_blacklists(self):
+        self.invalidate_blacklist()
+        await self.load_blacklists()
+
+    def on_event_blacklist_notify(self, payload: str):
+        try:
+            change = json.loads(payload)
+            guild_id = int(change["guild_id"])
+        except (ValueError, KeyError, TypeError):
+            logger.warning("NOTIFY de blacklist inválido: %s", payload)
+            return
+        index = self.blacklists.get(guild_id)
+        if index is not None:
+            # Eco de add_blacklist_entry / remove_blacklist_entry de este proceso.
+            current = index.by_external_id.get(change.get("external_id"))
+            if change.get("op") == "INSERT" and current is not None:
+                if current["user_id"] == change.get("user_id"):
+                    return
+            if change.get("op") == "DELETE" and current is None:
+                return
+        self.invalidate_blacklist(guild_id)
+
     async def require_event_admin(self, interaction: discord.Interaction) -> bool:
         if (
             isinstance(interaction.user, discord.Member)
@@ -970,7 +1141,7 @@ class RegistroEventos:
         if not await self.require_database(interaction):
             return
 
-        active = await database.get_active_event(interaction.guild.id)
+        active = await self.get_active_event(interaction.guild.id)
         if active:
             await send_ephemeral(
                 interaction,
@@ -1032,6 +1203,8 @@ class RegistroEventos:
             interaction.channel_id,
             interaction.user.id,
         )
+        if status in ("active", "created"):
+            self.cache_active_event(interaction.guild.id, event)
         if status == "active":
             await interaction.edit_original_response(
                 content=f"Ya existe un evento activo: **{event['event_name']}**.",
@@ -1051,7 +1224,8 @@ class RegistroEventos:
                 embed=registration_open_embed(event_name),
                 view=RegistrationView(self),
             )
-            await database.set_event_message(event["id"], message.id)
+            event = await database.set_event_message(event["id"], message.id)
+            self.cache_active_event(interaction.guild.id, event)
         except Exception:
             logger.exception("No se pudo publicar o persistir el panel del evento")
             if message is not None:
@@ -1061,7 +1235,9 @@ class RegistroEventos:
                     logger.exception("No se pudo retirar el panel huérfano del evento")
             try:
                 await database.delete_event(event["id"])
+                self.cache_active_event(interaction.guild.id, None)
             except Exception:
+                self.invalidate_active_event(interaction.guild.id)
                 logger.exception("No se pudo revertir la apertura del evento %s", event["id"])
             await interaction.edit_original_response(
                 content="No se pudo publicar el panel. La apertura fue revertida.",
@@ -1109,7 +1285,11 @@ class RegistroEventos:
             )
             return
 
-        event = await database.get_active_event(interaction.guild.id)
+        context = await database.get_registration_context(
+            interaction.guild.id,
+            interaction.user.id,
+        )
+        event = context["event"]
         if not event or event["status"] != "open":
             await send_ephemeral(interaction, "Las inscripciones de este evento estan cerradas.")
             return
@@ -1123,12 +1303,12 @@ class RegistroEventos:
                 "Este panel ya no corresponde al evento activo.",
             )
             return
-        if await database.get_event_registration(event["id"], interaction.user.id):
+        if context["registration"]:
             await send_ephemeral(interaction, "Ya estas registrado en este evento.")
             return
 
-        profile = await database.get_event_user(interaction.guild.id, interaction.user.id)
-        blacklist_entry = await database.get_event_blacklist_match(
+        profile = context["profile"]
+        blacklist_entry = await self.get_blacklist_match(
             interaction.guild.id,
             profile["external_id"] if profile else None,
             interaction.user.id,
@@ -1147,7 +1327,7 @@ class RegistroEventos:
             )
             return
 
-        count = await database.get_event_participant_count(event["id"])
+        count = context["participant_count"]
         overflow = event["participant_limit"] > 0 and count >= event["participant_limit"]
 
         if profile:
@@ -1256,7 +1436,7 @@ class RegistroEventos:
             )
             return
 
-        event = await database.get_active_event(guild.id)
+        event = await self.get_active_event(guild.id)
         if not event or event["status"] != "open":
             await interaction.followup.send(
                 "Las inscripciones de este evento estan cerradas.", ephemeral=True
@@ -1269,7 +1449,7 @@ class RegistroEventos:
             if existing_profile
             else profile["external_id"]
         )
-        blacklist_entry = await database.get_event_blacklist_match(
+        blacklist_entry = await self.get_blacklist_match(
             guild.id,
             effective_external_id,
             member.id,
@@ -1354,7 +1534,11 @@ class RegistroEventos:
 
         if not had_role:
             await self.remove_role_safely(member, participant_role)
+        if status in ("closed", "no_event"):
+            self.invalidate_active_event(guild.id)
         if status == "blacklisted":
+            # La función SQL sigue siendo la autoridad: el índice estaba desactualizado.
+            self.invalidate_blacklist(guild.id)
             await self.send_registration_rejection_alert(
                 guild,
                 member,
@@ -1372,7 +1556,10 @@ class RegistroEventos:
         )
 
     def schedule_message_deletion(self, message, delay: float):
-        task = asyncio.create_task(self.delete_message_later(message, delay))
+        self.schedule_background(self.delete_message_later(message, delay))
+
+    def schedule_background(self, coro):
+        task = asyncio.create_task(coro)
         self.background_tasks.add(task)
         task.add_done_callback(self.background_tasks.discard)
 
@@ -1396,7 +1583,7 @@ class RegistroEventos:
     async def show_staff_panel(self, interaction: discord.Interaction):
         if not interaction.guild or not await self.require_database(interaction):
             return
-        active = await database.get_active_event(interaction.guild.id)
+        active = await self.get_active_event(interaction.guild.id)
         await interaction.response.send_message(
             embed=staff_panel_embed(active),
             view=StaffPanelView(self),
@@ -1405,7 +1592,7 @@ class RegistroEventos:
     async def show_participants(self, interaction: discord.Interaction):
         if not interaction.guild or not await self.require_database(interaction):
             return
-        event = await database.get_active_event(interaction.guild.id)
+        event = await self.get_active_event(interaction.guild.id)
         if not event:
             await send_ephemeral(interaction, "No hay eventos activos.")
             return
@@ -1435,7 +1622,7 @@ class RegistroEventos:
     async def close_registration(self, interaction: discord.Interaction):
         if not interaction.guild or not await self.require_database(interaction):
             return
-        event = await database.get_active_event(interaction.guild.id)
+        event = await self.get_active_event(interaction.guild.id)
         if not event:
             await send_ephemeral(interaction, "No hay eventos activos.")
             return
@@ -1445,6 +1632,13 @@ class RegistroEventos:
 
         await interaction.response.defer(ephemeral=True)
         closed_event = await database.close_active_event(interaction.guild.id)
+        if closed_event is None:
+            self.invalidate_active_event(interaction.guild.id)
+            await interaction.followup.send(
+                "El evento ya no tiene inscripciones abiertas.", ephemeral=True
+            )
+            return
+        self.cache_active_event(interaction.guild.id, closed_event)
         panel_updated = await self.update_registration_message(closed_event, closed=True)
         try:
             await interaction.message.edit(
@@ -1483,7 +1677,7 @@ class RegistroEventos:
     async def request_finish_confirmation(self, interaction: discord.Interaction):
         if not interaction.guild or not await self.require_database(interaction):
             return
-        event = await database.get_active_event(interaction.guild.id)
+        event = await self.get_active_event(interaction.guild.id)
         if not event:
             await send_ephemeral(interaction, "No hay eventos activos.")
             return
@@ -1531,7 +1725,7 @@ class RegistroEventos:
         if not await self.require_database(interaction):
             return
 
-        event = await database.get_active_event(interaction.guild.id)
+        event = await self.get_active_event(interaction.guild.id)
         if not event or event["id"] != expected_event_id:
             await interaction.response.edit_message(
                 content="Este evento ya no está activo.", embed=None, view=None
@@ -1558,7 +1752,10 @@ class RegistroEventos:
         if event["status"] == "open":
             event = await database.close_active_event(interaction.guild.id)
             if event is None:
-                event = await database.get_active_event(interaction.guild.id)
+                self.invalidate_active_event(interaction.guild.id)
+                event = await self.get_active_event(interaction.guild.id)
+            else:
+                self.cache_active_event(interaction.guild.id, event)
         if not event:
             await interaction.edit_original_response(
                 content="El evento ya no está activo.", embed=None, view=None
@@ -1622,7 +1819,9 @@ class RegistroEventos:
 
         try:
             await database.delete_event(event["id"])
+            self.cache_active_event(interaction.guild.id, None)
         except Exception:
+            self.invalidate_active_event(interaction.guild.id)
             logger.exception("No se pudo limpiar el evento finalizado %s", event["id"])
             await interaction.edit_original_response(
                 content=(
@@ -1794,6 +1993,7 @@ class RegistroEventos:
                 "Ese Discord ID o ID Espacial ya está en la blacklist.",
             )
             return
+        self.update_blacklist(interaction.guild.id, added=row)
 
         rows = await database.get_event_blacklist(interaction.guild.id)
         await interaction.response.edit_message(
@@ -1818,6 +2018,8 @@ class RegistroEventos:
             interaction.guild.id,
             external_id,
         )
+        if removed is not None:
+            self.update_blacklist(interaction.guild.id, removed=removed)
         rows = await database.get_event_blacklist(interaction.guild.id)
         embed = blacklist_panel_embed(rows)
         if removed is None:
@@ -2078,7 +2280,7 @@ class RegistroEventos:
             if member is not None
             else profile["discord_tag"]
         )
-        active_event = await database.get_active_event(interaction.guild.id)
+        active_event = await self.get_active_event(interaction.guild.id)
         active_registration = (
             await database.get_event_registration(active_event["id"], user_id)
             if active_event
@@ -2256,6 +2458,18 @@ class RegistroEventos:
 
 def setup(bot):
     registro_eventos = RegistroEventos(bot)
+    database.DB_LISTENER.subscribe(
+        EVENT_CHANGES_CHANNEL,
+        registro_eventos.on_event_instances_notify,
+        on_reconnect=registro_eventos.resync_active_events,
+    )
+    database.DB_LISTENER.subscribe(
+        BLACKLIST_CHANGES_CHANNEL,
+        registro_eventos.on_event_blacklist_notify,
+        on_reconnect=registro_eventos.resync_blacklists,
+    )
+    if registro_eventos.database_ready():
+        registro_eventos.schedule_background(registro_eventos.load_blacklists())
     bot.add_view(RegistrationView(registro_eventos))
     bot.add_view(StaffPanelView(registro_eventos))
 